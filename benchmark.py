@@ -0,0 +1,560 @@
+#!/usr/bin/env python3
+"""Seed a synthetic catalogue and load-test the pet adoption server
+
+    python benchmark.py seed --db pets.db --pets 100000 --reset
+    python benchmark.py run --db pets.db --spawn --mode asyncio --duration 30 --output results.json
+
+Everything runs against localhost; no network access is needed.
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlparse
+
+SPECIES_BREEDS = {
+    'Dog': ['Golden Retriever', 'German Shepherd', 'Labrador', 'Beagle', 'Poodle', 'Bulldog', 'Husky', 'Deshi'],
+    'Cat': ['Siamese', 'Persian', 'Maine Coon', 'British Shorthair', 'Bengal', 'Ragdoll', 'Deshi'],
+    'Bird': ['Budgerigar', 'Cockatiel', 'Lovebird', 'Parrot', 'Finch'],
+    'Rabbit': ['Holland Lop', 'Lionhead', 'Dutch', 'Rex'],
+    'Other': ['Hamster', 'Guinea Pig', 'Turtle', 'Ferret']
+}
+SPECIES_WEIGHTS = [45, 35, 8, 7, 5]
+LOCATIONS = ['dhaka', 'chittagong', 'sylhet', 'rajshahi']
+NAMES = ['Buddy', 'Luna', 'Max', 'Bella', 'Charlie', 'Milo', 'Coco', 'Rocky', 'Daisy', 'Simba',
+         'Oliver', 'Lucy', 'Tiger', 'Shadow', 'Ginger', 'Pepper', 'Oreo', 'Leo', 'Kitty', 'Rex']
+BIO_WORDS = ['friendly', 'playful', 'calm', 'gentle', 'loyal', 'energetic', 'curious', 'shy',
+             'vaccinated', 'house-trained', 'loves', 'kids', 'walks', 'cuddles', 'toys', 'garden',
+             'quiet', 'apartment', 'active', 'family', 'smart', 'trained', 'healthy', 'young']
+SAMPLE_IMAGE = 'https://images.pexels.com/photos/551628/pexels-photo-551628.jpeg?auto=compress&cs=tinysrgb&w=400'
+UPLOAD_IMAGES = 20
+PASSWORD = 'password123'
+BATCH_SIZE = 10000
+
+def batches(rows, size=BATCH_SIZE):
+    """Group an iterable of rows into lists of at most size"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def insert_rows(conn, sql, rows):
+    count = 0
+    conn.execute('BEGIN')
+    for batch in batches(rows):
+        conn.executemany(sql, batch)
+        count += len(batch)
+    conn.commit()
+    return count
+
+def write_upload_images(upload_dir, rng, pillow=None):
+    """Write a few photos into the server's uploads directory and return their image paths
+
+    Real JPEGs when Pillow is available so the variant pipeline has work to
+    do; otherwise JPEG-framed noise, which the server serves as the original.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    images = []
+    for _ in range(UPLOAD_IMAGES):
+        filename = f'{uuid.uuid4()}.jpg'
+        path = os.path.join(upload_dir, filename)
+        if pillow is not None:
+            size = (rng.randint(800, 1600), rng.randint(600, 1200))
+            pillow.new('RGB', size, tuple(rng.randrange(256) for _ in range(3))).save(path, 'JPEG')
+        else:
+            with open(path, 'wb') as f:
+                f.write(b'\xff\xd8\xff\xe0' + rng.randbytes(48 * 1024) + b'\xff\xd9')
+        images.append(f'uploads/{filename}')
+    return images
+
+def seed_database(path, pets, users, applications, sessions, seed):
+    """Add a synthetic catalogue to the database at path, creating the schema first"""
+    # The schema, sample rows and migrations come from the server itself
+    import server
+    server.db_pool.path = path
+    server.init_database()
+
+    rng = random.Random(seed)
+    now = datetime.now()
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+
+    first_user = (conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0]) + 1
+    password_hash = hashlib.sha256(PASSWORD.encode()).hexdigest()
+    run_id = uuid.uuid4().hex[:8]
+    insert_rows(conn, 'INSERT INTO users (name, email, password_hash, phone) VALUES (?, ?, ?, ?)', (
+        (f'Bench User {i}', f'bench-{run_id}-{i}@example.com', password_hash, f'555-{i:07d}')
+        for i in range(users)
+    ))
+    user_ids = range(first_user, first_user + users)
+
+    # Donors are kept so applications and adoptions can name the right one
+    first_pet = (conn.execute('SELECT COALESCE(MAX(id), 0) FROM pets').fetchone()[0]) + 1
+    donors = []
+    adopted = []
+    # Half the pets use photos served by the server itself, like donations do
+    upload_dir = os.path.join(os.path.dirname(os.path.abspath(path)), 'uploads')
+    images = write_upload_images(upload_dir, rng, server.Image)
+
+    def pet_rows():
+        species_names = list(SPECIES_BREEDS)
+        for i in range(pets):
+            species = rng.choices(species_names, SPECIES_WEIGHTS)[0]
+            donor = rng.choice(user_ids)
+            status = 'adopted' if rng.random() < 0.1 else 'available'
+            donors.append(donor)
+            if status == 'adopted':
+                adopted.append(first_pet + i)
+            yield (
+                rng.choice(NAMES), rng.randint(0, 15), rng.choice(SPECIES_BREEDS[species]), species,
+                ' '.join(rng.choice(BIO_WORDS) for _ in range(rng.randint(8, 20))).capitalize() + '.',
+                rng.choice(images) if rng.random() < 0.5 else SAMPLE_IMAGE, donor, status,
+                now - timedelta(seconds=rng.randint(0, 2 * 365 * 86400)),
+                rng.choice(LOCATIONS), 0 if rng.random() < 0.3 else rng.randint(1, 500) * 100
+            )
+
+    insert_rows(conn, '''
+        INSERT INTO pets (name, age, breed, species, bio, image, donated_by, status, created_at, location, price)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', pet_rows())
+
+    def application_rows():
+        for _ in range(applications):
+            index = rng.randrange(pets)
+            applicant = rng.choice(user_ids)
+            yield (
+                first_pet + index, applicant, donors[index], f'Bench User {applicant - first_user}',
+                f'bench-{run_id}-{applicant - first_user}@example.com', '555-0000',
+                'Had pets before', 'House with a garden', 'Looking for a companion',
+                rng.choice(['pending', 'pending', 'pending', 'rejected']),
+                now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            )
+
+    if pets:
+        insert_rows(conn, '''
+            INSERT INTO adoption_applications
+            (pet_id, applicant_id, donor_id, applicant_name, applicant_email, applicant_phone,
+             experience, living_situation, reason, status, applied_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', application_rows())
+        insert_rows(conn, 'INSERT INTO adoptions (pet_id, adopter_id, donor_id, adopted_at) VALUES (?, ?, ?, ?)', (
+            (pet_id, rng.choice(user_ids), donors[pet_id - first_pet],
+             now - timedelta(seconds=rng.randint(0, 365 * 86400)))
+            for pet_id in adopted
+        ))
+
+    # Live sessions the load generator can present as cookies
+    insert_rows(conn, 'INSERT INTO sessions (session_id, user_id, expires_at) VALUES (?, ?, ?)', (
+        (f'bench-{run_id}-{i}', rng.choice(user_ids), int(time.time()) + 30 * 86400)
+        for i in range(sessions if users else 0)
+    ))
+
+    conn.execute('ANALYZE')
+    conn.close()
+    return {'users': users, 'pets': pets, 'applications': applications if pets else 0,
+            'adoptions': len(adopted), 'sessions': sessions if users else 0}
+
+class Context:
+    """What the load generator knows about the target database"""
+
+    def __init__(self, db_path):
+        self.max_pet_id = 1
+        self.sessions = []
+        self.users = []
+        self.admin = None
+        if not db_path or not os.path.exists(db_path):
+            return
+        conn = sqlite3.connect(db_path)
+        self.max_pet_id = conn.execute('SELECT COALESCE(MAX(id), 1) FROM pets').fetchone()[0]
+        self.sessions = [row[0] for row in conn.execute(
+            "SELECT session_id FROM sessions WHERE session_id LIKE 'bench-%' LIMIT 1000")]
+        self.users = [row[0] for row in conn.execute(
+            "SELECT email FROM users WHERE email LIKE 'bench-%' LIMIT 1000")]
+        conn.close()
+
+class Stats:
+    """Latency samples and status counts per route label, shared by all workers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.statuses = {}
+        self.errors = {}
+        self.recording = False
+
+    def record(self, label, status, seconds):
+        if not self.recording:
+            return
+        with self._lock:
+            self.samples.setdefault(label, []).append(seconds)
+            statuses = self.statuses.setdefault(label, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 'error' or (isinstance(status, int) and status >= 500):
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return None
+    index = max(0, min(len(sorted_samples) - 1, int(round(fraction * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+def summarize(samples, duration):
+    ordered = sorted(samples)
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+    return {
+        'count': len(ordered),
+        'throughput_rps': round(len(ordered) / duration, 2) if duration else None,
+        'latency_ms': {
+            'p50': ms(percentile(ordered, 0.50)),
+            'p95': ms(percentile(ordered, 0.95)),
+            'p99': ms(percentile(ordered, 0.99)),
+            'mean': ms(sum(ordered) / len(ordered)) if ordered else None,
+            'max': ms(ordered[-1]) if ordered else None
+        }
+    }
+
+class Client:
+    """One HTTP connection per worker; http.client reopens it when the server closes"""
+
+    def __init__(self, host, port, stats):
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.cookie = None
+
+    def request(self, method, path, label, body=None, headers=None, cookie=None):
+        headers = dict(headers or {})
+        cookie = cookie or self.cookie
+        if cookie:
+            headers['Cookie'] = f'session_id={cookie}'
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status = response.status
+            set_cookie = response.getheader('Set-Cookie') or ''
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.stats.record(label, 'error', time.perf_counter() - start)
+            return None, None, None
+        self.stats.record(label, status, time.perf_counter() - start)
+        return status, data, set_cookie
+
+    def json(self, method, path, label, payload=None, cookie=None):
+        body = None if payload is None else json.dumps(payload).encode('utf-8')
+        headers = {'Content-Type': 'application/json'} if body is not None else None
+        status, data, set_cookie = self.request(method, path, label, body, headers, cookie)
+        try:
+            return status, json.loads(data) if data else None, set_cookie
+        except ValueError:
+            return status, None, set_cookie
+
+    def login(self, email, password=PASSWORD):
+        status, _, set_cookie = self.json('POST', '/api/login', 'POST /api/login',
+                                          {'email': email, 'password': password})
+        if status == 200 and set_cookie.startswith('session_id='):
+            return set_cookie.split(';')[0].split('=', 1)[1]
+        return None
+
+    def donate(self, rng, cookie, name=None):
+        boundary = uuid.uuid4().hex
+        fields = {
+            'name': name or rng.choice(NAMES), 'age': str(rng.randint(0, 15)), 'breed': 'Deshi',
+            'species': rng.choice(list(SPECIES_BREEDS)), 'bio': 'Benchmark donation',
+            'location': rng.choice(LOCATIONS), 'price': str(rng.randint(0, 200) * 100)
+        }
+        parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode()
+                 for key, value in fields.items()]
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="pet.jpg"\r\n'
+                     'Content-Type: image/jpeg\r\n\r\n'.encode())
+        parts.append(b'\xff\xd8\xff\xe0' + rng.randbytes(48 * 1024) + b'\xff\xd9\r\n')
+        parts.append(f'--{boundary}--\r\n'.encode())
+        body = b''.join(parts)
+        status, _, _ = self.request('POST', '/api/donate', 'POST /api/donate', body,
+                                    {'Content-Type': f'multipart/form-data; boundary={boundary}'}, cookie)
+        return status
+
+def listing_query(rng, context):
+    """A filter combination like the browse page sends"""
+    params = {'page': rng.choice([1, 1, 1, 2, 2, 3, 5, 10])}
+    if rng.random() < 0.5:
+        params['category'] = rng.choice(list(SPECIES_BREEDS))
+    if rng.random() < 0.3:
+        params['sort'] = rng.choice(['newest', 'oldest', 'price-low', 'price-high'])
+    if rng.random() < 0.2:
+        params['location'] = rng.choice(LOCATIONS)
+    if rng.random() < 0.2:
+        params['minPrice'] = rng.choice([0, 1000, 5000])
+        params['maxPrice'] = rng.choice([10000, 20000, 50000])
+    pairs = list(params.items())
+    if rng.random() < 0.2:
+        pairs += [('ages[]', age) for age in rng.sample(['0-1', '1-3', '3-5', '5+'], rng.randint(1, 2))]
+    if rng.random() < 0.2:
+        pairs += [('locations[]', location) for location in rng.sample(LOCATIONS, rng.randint(1, 2))]
+    return urlencode(pairs)
+
+def scenario_browse(client, rng, context):
+    """Anonymous visitor: home page, assets, a few listing pages, a pet and its photos"""
+    client.request('GET', '/', 'GET /')
+    client.request('GET', '/style.css', 'GET /style.css')
+    client.request('GET', '/script.js', 'GET /script.js')
+    client.request('GET', '/api/user', 'GET /api/user')
+    if rng.random() < 0.2:
+        page = rng.choice(['login', 'signup'])
+        client.request('GET', f'/{page}.html', f'GET /{page}.html')
+    for page in range(1, rng.randint(2, 4)):
+        client.request('GET', f'/api/pets?page={page}', 'GET /api/pets')
+    client.request('GET', '/api/pets/facets', 'GET /api/pets/facets')
+    pet_id = rng.randint(1, context.max_pet_id)
+    _, pet, _ = client.json('GET', f'/api/pets/{pet_id}?include=donor', 'GET /api/pets/<pet_id>')
+    # External images are not ours to serve; uploaded ones have variants
+    if isinstance(pet, dict) and pet.get('images'):
+        client.request('GET', pet['images']['thumb'], 'GET /uploads/<id>/<size>',
+                       headers={'Accept': rng.choice(['image/webp,*/*', 'image/jpeg,*/*'])})
+        if rng.random() < 0.3:
+            client.request('GET', '/' + pet['image'], 'GET /uploads/<name>')
+
+def scenario_search(client, rng, context):
+    """Filtered and full-text search with facet counts"""
+    query = listing_query(rng, context)
+    if rng.random() < 0.5:
+        term = rng.choice(NAMES + [breed for breeds in SPECIES_BREEDS.values() for breed in breeds])
+        query += '&' + urlencode({'search': term.lower()[:rng.randint(3, len(term))]})
+    client.request('GET', f'/api/pets?{query}', 'GET /api/pets')
+    client.request('GET', f'/api/pets/facets?{query}', 'GET /api/pets/facets')
+
+def scenario_dashboard(client, rng, context):
+    """Signed-in user opening the dashboard"""
+    cookie = rng.choice(context.sessions) if context.sessions else client.cookie
+    client.request('GET', '/dashboard.html', 'GET /dashboard.html', cookie=cookie)
+    client.request('GET', '/api/user', 'GET /api/user', cookie=cookie)
+    client.request('GET', '/api/my-donations/pending', 'GET /api/my-donations/pending', cookie=cookie)
+    client.request('GET', '/api/my-donations', 'GET /api/my-donations', cookie=cookie)
+    client.request('GET', '/api/applications', 'GET /api/applications', cookie=cookie)
+    client.request('GET', '/api/adoptions', 'GET /api/adoptions', cookie=cookie)
+
+def scenario_donate(client, rng, context):
+    """Signed-in user posting a pet with a photo upload"""
+    cookie = rng.choice(context.sessions) if context.sessions else client.cookie
+    client.donate(rng, cookie)
+
+def scenario_account(client, rng, context):
+    """New visitor signs up, logs in, applies for a pet and logs out"""
+    email = f'bench-signup-{uuid.uuid4().hex}@example.com'
+    client.json('POST', '/api/signup', 'POST /api/signup',
+                {'name': 'Bench Signup', 'email': email, 'password': PASSWORD, 'phone': '555-0000'})
+    cookie = client.login(email)
+    if cookie is None:
+        return
+    client.json('POST', '/api/apply', 'POST /api/apply', {
+        'pet_id': rng.randint(1, context.max_pet_id), 'experience': 'Some',
+        'living_situation': 'Flat', 'reason': 'Benchmark'
+    }, cookie=cookie)
+    client.json('POST', '/api/logout', 'POST /api/logout', cookie=cookie)
+
+def scenario_manage(client, rng, context):
+    """Donor lifecycle: donate, receive an application, approve it, delete and remove pets"""
+    donor = client.login(rng.choice(context.users)) if context.users else client.cookie
+    applicant = rng.choice(context.sessions) if context.sessions else None
+    if donor is None or applicant is None:
+        return
+    name = f'Bench-{uuid.uuid4().hex[:8]}'
+    client.donate(rng, donor, name)
+    client.donate(rng, donor, name)
+    _, donations, _ = client.json('GET', '/api/my-donations?per_page=5', 'GET /api/my-donations', cookie=donor)
+    mine = [donation for donation in donations or [] if donation.get('name') == name]
+    if len(mine) < 2:
+        return
+    client.json('POST', '/api/apply', 'POST /api/apply', {
+        'pet_id': mine[0]['id'], 'experience': 'Some', 'living_situation': 'Flat', 'reason': 'Benchmark'
+    }, cookie=applicant)
+    _, donations, _ = client.json('GET', '/api/my-donations?per_page=5', 'GET /api/my-donations', cookie=donor)
+    for donation in donations or []:
+        if donation.get('id') == mine[0]['id'] and donation.get('applications'):
+            client.json('POST', '/api/approve-application', 'POST /api/approve-application',
+                        {'application_id': donation['applications'][0]['id']}, cookie=donor)
+    client.json('POST', '/api/remove-donation', 'POST /api/remove-donation',
+                {'donation_id': mine[1]['id']}, cookie=donor)
+    if context.admin:
+        client.json('POST', '/api/delete-pet', 'POST /api/delete-pet',
+                    {'pet_id': mine[0]['id']}, cookie=context.admin)
+
+SCENARIOS = {
+    'browse': scenario_browse,
+    'search': scenario_search,
+    'dashboard': scenario_dashboard,
+    'donate': scenario_donate,
+    'account': scenario_account,
+    'manage': scenario_manage
+}
+DEFAULT_MIX = 'browse=55,search=25,dashboard=12,donate=4,account=2,manage=2'
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'unknown scenario {name!r}; choose from {", ".join(SCENARIOS)}')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def spawn_server(db_path, mode, extra_args):
+    """Start server.py in the directory holding the database and wait until it answers"""
+    port = free_port()
+    workdir = os.path.dirname(os.path.abspath(db_path))
+    if os.path.basename(db_path) != 'pets.db':
+        raise SystemExit('--spawn needs the database to be named pets.db (the server opens ./pets.db)')
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+    process = subprocess.Popen([sys.executable, server_path, '--host', '127.0.0.1', '--port', str(port),
+                                '--mode', mode, *extra_args], cwd=workdir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'server exited with status {process.returncode} during startup')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit('server did not start within 120s')
+
+def run_load(url, context, mix, concurrency, duration, warmup, seed):
+    """Drive the server with concurrency workers and return the summary dict"""
+    target = urlparse(url)
+    host, port = target.hostname, target.port or 80
+    stats = Stats()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    # One admin session for delete-pet, from the seeded sample data
+    setup = Client(host, port, stats)
+    context.admin = setup.login('admin@petcenter.com')
+
+    stop = threading.Event()
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = Client(host, port, stats)
+        if context.users:
+            client.cookie = client.login(rng.choice(context.users))
+        while not stop.is_set():
+            scenario = SCENARIOS[rng.choices(names, weights)[0]]
+            scenario(client, rng, context)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    stats.recording = True
+    started = time.perf_counter()
+    time.sleep(duration)
+    stats.recording = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=35)
+
+    all_samples = [sample for samples in stats.samples.values() for sample in samples]
+    summary = summarize(all_samples, elapsed)
+    summary['errors'] = sum(stats.errors.values())
+    summary['duration_s'] = round(elapsed, 3)
+    summary['routes'] = {}
+    for label in sorted(stats.samples):
+        route = summarize(stats.samples[label], elapsed)
+        route['errors'] = stats.errors.get(label, 0)
+        route['statuses'] = stats.statuses[label]
+        summary['routes'][label] = route
+    return summary
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Seed and load-test the pet adoption server')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed = commands.add_parser('seed', help='add a synthetic catalogue to a database')
+    seed.add_argument('--db', default='pets.db')
+    seed.add_argument('--pets', type=int, default=10000)
+    seed.add_argument('--users', type=int, default=None, help='default: one per 10 pets')
+    seed.add_argument('--applications', type=int, default=None, help='default: two per pet')
+    seed.add_argument('--sessions', type=int, default=1000)
+    seed.add_argument('--seed', type=int, default=42)
+    seed.add_argument('--reset', action='store_true', help='delete the database first')
+
+    run = commands.add_parser('run', help='load-test a server and report latency percentiles as JSON')
+    run.add_argument('--url', default='http://127.0.0.1:8000')
+    run.add_argument('--db', default='pets.db', help='database the server uses; read for pet ids and sessions')
+    run.add_argument('--spawn', action='store_true', help='start server.py next to --db instead of using --url')
+    run.add_argument('--mode', default='threaded', help='server --mode when spawning')
+    run.add_argument('--server-arg', action='append', default=[], help='extra server.py argument when spawning')
+    run.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                     help=f'scenario weights (default {DEFAULT_MIX})')
+    run.add_argument('--concurrency', type=int, default=16)
+    run.add_argument('--duration', type=float, default=30)
+    run.add_argument('--warmup', type=float, default=3)
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--output', help='also write the JSON report here')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.command == 'seed':
+        if args.reset:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(args.db + suffix):
+                    os.remove(args.db + suffix)
+        users = args.users if args.users is not None else max(1, args.pets // 10)
+        applications = args.applications if args.applications is not None else args.pets * 2
+        started = time.perf_counter()
+        counts = seed_database(args.db, args.pets, users, applications, args.sessions, args.seed)
+        counts['seconds'] = round(time.perf_counter() - started, 2)
+        print(json.dumps(counts))
+        raise SystemExit(0)
+
+    process = None
+    url = args.url
+    if args.spawn:
+        process, url = spawn_server(args.db, args.mode, args.server_arg)
+    try:
+        summary = run_load(url, Context(args.db), args.mix, args.concurrency,
+                           args.duration, args.warmup, args.seed)
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+
+    summary['config'] = {
+        'url': url, 'mode': args.mode if args.spawn else None, 'mix': args.mix,
+        'concurrency': args.concurrency, 'duration_s': args.duration, 'seed': args.seed
+    }
+    report = json.dumps(summary, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
@@ -198,6 +198,8 @@ async function loadPets(page = 1, sort = 'newest') {
             }
         });
         
+        loadFacets(params);
+        
         const url = `/api/pets?${params.toString()}`;
         const response = await fetch(url);
         const data = await response.json();
@@ -212,6 +214,42 @@ async function loadPets(page = 1, sort = 'newest') {
     }
 }
 
+// Per-filter counts for the sidebar and category tiles
+async function loadFacets(listingParams) {
+    const params = new URLSearchParams(listingParams);
+    params.delete('page');
+    params.delete('sort');
+    
+    try {
+        const response = await fetch(`/api/pets/facets?${params.toString()}`);
+        if (!response.ok) return;
+        const facets = await response.json();
+        
+        const speciesTotal = Object.values(facets.species).reduce((sum, count) => sum + count, 0);
+        document.querySelectorAll('.category-item').forEach(item => {
+            const category = item.dataset.category;
+            setFacetCount(item, category === 'all' ? speciesTotal : (facets.species[category] || 0));
+        });
+        document.querySelectorAll('.checkbox-group label').forEach(label => {
+            const value = label.querySelector('input').value;
+            const counts = value in facets.ages ? facets.ages : facets.locations;
+            setFacetCount(label, counts[value] || 0);
+        });
+    } catch (error) {
+        console.error('Error loading filter counts:', error);
+    }
+}
+
+function setFacetCount(element, count) {
+    let badge = element.querySelector('.facet-count');
+    if (!badge) {
+        badge = document.createElement('small');
+        badge.className = 'facet-count';
+        element.appendChild(badge);
+    }
+    badge.textContent = `(${count})`;
+}
+
 function displayPets(pets) {
     const petsGrid = document.getElementById('pets-grid');
     
@@ -224,7 +262,7 @@ function displayPets(pets) {
     
     petsGrid.innerHTML = pets.map(pet => `
         <div class="pet-card" onclick="showPetDetails(${pet.id})">
-            <img src="${pet.image}" alt="${pet.name}" class="pet-image" onerror="this.src='https://images.pexels.com/photos/45201/kitty-cat-kitten-pet-45201.jpeg?auto=compress&cs=tinysrgb&w=400'">
+            <img src="${pet.images ? pet.images.thumb : pet.image}" alt="${pet.name}" class="pet-image" loading="lazy" onerror="this.src='https://images.pexels.com/photos/45201/kitty-cat-kitten-pet-45201.jpeg?auto=compress&cs=tinysrgb&w=400'">
             <div class="pet-info">
                 <div class="pet-header">
                     <h3 class="pet-name">${pet.name}</h3>
@@ -296,13 +334,14 @@ function updatePagination(data) {
 // Pet detail functions
 async function showPetDetails(petId) {
     try {
-        const response = await fetch(`/api/pets?page=1`);
-        const data = await response.json();
-        const pet = data.pets.find(p => p.id === petId);
+        const response = await fetch(`/api/pets/${petId}?include=donor`);
         
-        if (pet) {
+        if (response.ok) {
+            const pet = await response.json();
             displayPetModal(pet);
             document.getElementById('pet-modal').style.display = 'block';
+        } else {
+            showError('This pet is no longer listed.');
         }
     } catch (error) {
         console.error('Error loading pet details:', error);
@@ -316,7 +355,7 @@ function displayPetModal(pet) {
     
     petDetails.innerHTML = `
         <div class="pet-detail-modal">
-            <img src="${pet.image}" alt="${pet.name}" class="pet-detail-image" onerror="this.src='https://images.pexels.com/photos/45201/kitty-cat-kitten-pet-45201.jpeg?auto=compress&cs=tinysrgb&w=400'">
+            <img src="${pet.images ? pet.images.medium : pet.image}" alt="${pet.name}" class="pet-detail-image" onerror="this.src='https://images.pexels.com/photos/45201/kitty-cat-kitten-pet-45201.jpeg?auto=compress&cs=tinysrgb&w=400'">
             
             <div class="pet-detail-header">
                 <h2 class="pet-detail-title">${pet.name}</h2>
@@ -332,6 +371,7 @@ function displayPetModal(pet) {
                 <div class="pet-spec"><strong>Status:</strong> ${pet.status}</div>
                 <div class="pet-spec"><strong>Location:</strong> ${pet.location || 'Dhaka'}</div>
                 <div class="pet-spec"><strong>Posted:</strong> ${new Date(pet.created_at).toLocaleDateString()}</div>
+                ${pet.donor ? `<div class="pet-spec"><strong>Posted by:</strong> <span class="pet-donor-name"></span></div>` : ''}
             </div>
             
             <div class="pet-detail-description">
@@ -349,6 +389,11 @@ function displayPetModal(pet) {
             </div>
         </div>
     `;
+    
+    // Account names are user-supplied, so they go in as text rather than markup
+    if (pet.donor) {
+        petDetails.querySelector('.pet-donor-name').textContent = pet.donor.name;
+    }
 }
 
 function closeModal() {
@@ -5,453 +5,3020 @@ import os
 import uuid
 import hashlib
 import base64
+import argparse
+import signal
+import threading
+import queue
+import time
+import multiprocessing
+import asyncio
+import socket
+import selectors
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+import functools
+import itertools
+import copy
+import pickle
+import bisect
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs, unquote
-import io
+import re
+import stat
+import glob
+import tempfile
+import shutil
 import mimetypes
-from datetime import datetime, timedelta
+import email.utils
+from datetime import datetime
 import secrets
+import gzip
+import zlib
+import csv
+import zipfile
+import tarfile
 
-class PetAdoptionHandler(BaseHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        self.sessions = {}
-        super().__init__(*args, **kwargs)
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-    def parse_multipart(self, data, boundary):
-        """Parse multipart form data manually"""
-        parts = data.split(('--' + boundary).encode())
-        form_data = {}
-        files = {}
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+def int_param(query, name, default, minimum=1, maximum=None):
+    """Read an integer query parameter, falling back to default when invalid"""
+    try:
+        value = int(query.get(name, [default])[0])
+    except (TypeError, ValueError):
+        return default
+    value = max(value, minimum)
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
+# Set by init_database once the pets_fts full-text index is known to exist;
+# search falls back to LIKE scans on SQLite builds without FTS5
+pets_fts_enabled = False
+
+def pet_search_match(search):
+    """Turn free text into an FTS5 query that prefix-matches every word"""
+    words = re.findall(r'\w+', search)
+    return ' '.join(f'"{word}"*' for word in words)
+
+# Age ranges offered by the browse sidebar as (label, low, high). They share
+# their endpoints, so a pet aged 1 or 3 falls in two buckets.
+AGE_BUCKETS = (('0-1', 0, 1), ('1-3', 1, 3), ('3-5', 3, 5), ('5+', 5, None))
+
+def age_bucket_labels(age):
+    """Labels of the AGE_BUCKETS an age falls in"""
+    return [label for label, low, high in AGE_BUCKETS
+            if age >= low and (high is None or age <= high)]
+
+def build_pet_filters(query, join_search=False, include_status=True):
+    """Build the WHERE clause and parameters for the /api/pets filters
+
+    With join_search the caller joins pets_fts itself (to rank by relevance)
+    and the search condition is left out of the WHERE clause. Without
+    include_status the clause can also be applied to pet_counts.
+    """
+    where_conditions = ['status = "available"'] if include_status else []
+    params = []
+    
+    # Category filter
+    if 'category' in query and query['category'][0] != 'all':
+        where_conditions.append('species = ?')
+        params.append(query['category'][0])
+    
+    # Search filter
+    if 'search' in query and query['search'][0]:
+        # Text with no word characters can't be put to the index, so it
+        # falls back to LIKE like builds without FTS5
+        match = pet_search_match(query['search'][0]) if pets_fts_enabled else ''
+        if match:
+            if not join_search:
+                where_conditions.append('id IN (SELECT rowid FROM pets_fts WHERE pets_fts MATCH ?)')
+                params.append(match)
+        else:
+            search_term = f"%{query['search'][0]}%"
+            where_conditions.append('(name LIKE ? OR breed LIKE ? OR bio LIKE ?)')
+            params.extend([search_term, search_term, search_term])
+    
+    # Location filter
+    if 'location' in query and query['location'][0]:
+        where_conditions.append('location = ?')
+        params.append(query['location'][0])
+    
+    # Price filters; bounds that aren't whole numbers are ignored
+    min_price = int_param(query, 'minPrice', None, minimum=0)
+    if min_price is not None:
+        where_conditions.append('price >= ?')
+        params.append(min_price)
+    
+    max_price = int_param(query, 'maxPrice', None, minimum=0)
+    if max_price is not None:
+        where_conditions.append('price <= ?')
+        params.append(max_price)
+    
+    # Age filters
+    if 'ages[]' in query:
+        age_conditions = []
+        for label, low, high in AGE_BUCKETS:
+            if label in query['ages[]']:
+                if high is None:
+                    age_conditions.append(f'age >= {low}')
+                else:
+                    age_conditions.append(f'age BETWEEN {low} AND {high}')
         
-        for part in parts[1:-1]:  # Skip first empty part and last closing part
-            if not part.strip():
+        if age_conditions:
+            where_conditions.append(f"({' OR '.join(age_conditions)})")
+    
+    # Location filters (from checkboxes)
+    if 'locations[]' in query:
+        location_conditions = []
+        for location in query['locations[]']:
+            location_conditions.append('location = ?')
+            params.append(location)
+        
+        if location_conditions:
+            where_conditions.append(f"({' OR '.join(location_conditions)})")
+    
+    return ' AND '.join(where_conditions) or '1', params
+
+def uses_summary_filters(query):
+    """True when the only filters are species, location and age, which pet_counts covers"""
+    return (not query.get('search', [''])[0]
+            and int_param(query, 'minPrice', None) is None
+            and int_param(query, 'maxPrice', None) is None)
+
+def pet_count_query(query):
+    """Build the (sql, params) that counts the pets matching the /api/pets filters"""
+    if uses_summary_filters(query):
+        # A sum over at most a few hundred summary rows
+        where_clause, params = build_pet_filters(query, include_status=False)
+        return f'SELECT COALESCE(SUM(available), 0) FROM pet_counts WHERE {where_clause}', params
+    where_clause, params = build_pet_filters(query)
+    return f'SELECT COUNT(*) FROM pets WHERE {where_clause}', params
+
+# Sort options for /api/pets as (column, direction). id breaks ties so each
+# sort is a total order that a keyset cursor can resume from. relevance
+# orders by the bm25 rank of the joined search subquery.
+PET_SORTS = {
+    'newest': ('created_at', 'DESC'),
+    'oldest': ('created_at', 'ASC'),
+    'price-low': ('price', 'ASC'),
+    'price-high': ('price', 'DESC'),
+    'relevance': ('search.rank', 'ASC'),
+}
+
+def pet_sort_option(query):
+    searching = bool(pets_fts_enabled and pet_search_match(query.get('search', [''])[0]))
+    sort_option = query.get('sort', ['relevance' if searching else 'newest'])[0]
+    if sort_option not in PET_SORTS or (sort_option == 'relevance' and not searching):
+        return 'newest'
+    return sort_option
+
+def pet_sort_clause(sort_option):
+    """Map a sort option to its ORDER BY clause"""
+    column, direction = PET_SORTS[sort_option]
+    return f'ORDER BY {column} {direction}, id {direction}'
+
+def encode_pet_cursor(sort_option, sort_value, pet_id):
+    """Opaque token for the position just after the given row"""
+    raw = json.dumps([sort_option, sort_value, pet_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_pet_cursor(token, sort_option):
+    """Return (sort_value, pet_id) from a cursor, or raise ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        cursor_sort, sort_value, pet_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort_option or not isinstance(pet_id, int):
+        raise ValueError('Cursor does not match the requested sort')
+    return sort_value, pet_id
+
+def build_pet_page_query(query, sort_option, limit, offset=0, after=None):
+    """Build the (sql, params) that selects one page of /api/pets
+
+    after is a decoded cursor, (sort_value, id) of the last row already
+    seen. Each row carries its sort value as a trailing extra column.
+    """
+    sort_column, direction = PET_SORTS[sort_option]
+    
+    if sort_option == 'relevance':
+        # Rank by joining the full-text matches instead of filtering on them;
+        # name matches outrank breed matches, which outrank bio matches
+        where_clause, params = build_pet_filters(query, join_search=True)
+        from_clause = '''pets JOIN (
+            SELECT rowid AS pet_id, bm25(pets_fts, 10.0, 5.0, 1.0) AS rank
+            FROM pets_fts WHERE pets_fts MATCH ?
+        ) AS search ON search.pet_id = pets.id'''
+        params = [pet_search_match(query['search'][0])] + params
+    else:
+        where_clause, params = build_pet_filters(query)
+        from_clause = 'pets'
+    
+    if after is not None:
+        comparison = '<' if direction == 'DESC' else '>'
+        where_clause += f' AND ({sort_column}, id) {comparison} (?, ?)'
+        params = params + list(after)
+    
+    sql = f'''
+        SELECT {PET_COLUMNS}, {sort_column}
+        FROM {from_clause} WHERE {where_clause}
+        {pet_sort_clause(sort_option)}
+        LIMIT ? OFFSET ?
+    '''
+    return sql, params + [limit, offset]
+
+def dump_json(data):
+    """Serialize a response to UTF-8 JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data).encode('utf-8')
+
+def json_value(value):
+    """Encode one column value the way json.dumps would"""
+    if value is None:
+        return 'null'
+    if isinstance(value, str):
+        return json.encoder.encode_basestring_ascii(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return int.__repr__(value)
+    return json.dumps(value)
+
+class RowTemplate:
+    """Encodes result rows straight to JSON objects, without building dicts
+
+    The keys and punctuation for one query shape are encoded once into a
+    format string, so each row only has its values encoded. Raw names are
+    trailing keys whose values are passed to encode() already encoded.
+    Output matches json.dumps byte for byte.
+    """
+
+    def __init__(self, names, raw_names=()):
+        self.names = names
+        self.raw_names = raw_names
+        keys = [json.encoder.encode_basestring_ascii(name).replace('%', '%%') for name in names + raw_names]
+        self._format = '{' + ', '.join(key + ': %s' for key in keys) + '}'
+
+    def encode(self, row, *raw):
+        return self._format % (tuple(map(json_value, row)) + raw)
+
+@functools.lru_cache(maxsize=256)
+def row_template(names, raw_names=()):
+    return RowTemplate(names, raw_names)
+
+def cursor_template(cursor, start=0, raw_names=()):
+    """RowTemplate keyed by the column names of an executed query, from column start on"""
+    return row_template(tuple(column[0] for column in cursor.description[start:]), raw_names)
+
+# Columns selected for a pet, in the order pet_from_row expects
+PET_FIELDS = ('id', 'name', 'breed', 'age', 'species', 'image', 'bio', 'status', 'donated_by',
+              'location', 'price', 'created_at')
+PET_COLUMNS = ', '.join(PET_FIELDS)
+
+def pet_from_row(row):
+    return {
+        'id': row[0],
+        'name': row[1],
+        'breed': row[2],
+        'age': row[3],
+        'species': row[4],
+        'image': row[5],
+        'bio': row[6],
+        'status': row[7],
+        'donated_by': row[8],
+        'location': row[9],
+        'price': row[10],
+        'created_at': row[11],
+        'images': image_variant_urls(row[5])
+    }
+
+def encode_pet_row(row):
+    """pet_from_row, encoded straight to JSON"""
+    return row_template(PET_FIELDS + ('images',)).encode(row[:12] + (image_variant_urls(row[5]),))
+
+class LRUCache:
+    """Thread-safe LRU mapping with an optional per-entry time to live"""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self._entries)
+
+class CatalogueGeneration:
+    """Generation bumped by every write that can change what /api/pets returns
+
+    Cached listings are keyed by the generation they were built at, so a
+    bump invalidates all of them at once. Writes made by this server bump
+    a counter in shared memory created before any fork, which every
+    prefork worker sees at once without touching SQLite. Writes from other
+    processes, such as an --import-pets run or a second server, only reach
+    the catalogue_generation row that triggers on pets keep. Each process
+    re-reads that row at most every refresh_interval seconds.
+    """
+    refresh_interval = 1.0
+
+    def __init__(self):
+        self._value = multiprocessing.Value('Q', 0)
+        self._lock = threading.Lock()
+        self._stored = None
+        self._read_at = None
+
+    def current(self):
+        now = time.monotonic()
+        if self._read_at is None or now - self._read_at >= self.refresh_interval:
+            with self._lock:
+                if self._read_at is None or now - self._read_at >= self.refresh_interval:
+                    with db_pool.connection() as conn:
+                        self._stored = conn.execute('SELECT value FROM catalogue_generation').fetchone()[0]
+                    self._read_at = now
+        return self._value.value, self._stored
+
+    def bump(self):
+        with self._value.get_lock():
+            self._value.value += 1
+
+    def bump_stored(self, cursor):
+        """Bump the database row after a write the pets triggers don't see"""
+        cursor.execute('UPDATE catalogue_generation SET value = value + 1')
+
+catalogue = CatalogueGeneration()
+
+# Listing totals per (generation, filter signature)
+pet_count_cache = LRUCache(maxsize=1024)
+
+# Serialized /api/pets responses per (generation, normalized query), as
+# CompressedBody so each coding is compressed once. The listing is the same
+# for every visitor, so one entry serves everyone.
+pet_listing_cache = LRUCache(maxsize=512)
+
+PET_LISTING_PARAMS = ('category', 'search', 'location', 'minPrice', 'maxPrice',
+                      'ages[]', 'locations[]', 'sort', 'page', 'cursor', 'count')
+
+def listing_cache_key(query, names=PET_LISTING_PARAMS):
+    """Normalize a /api/pets query so equivalent requests share a cache entry"""
+    return tuple(
+        (name, tuple(sorted(value for value in query[name] if value)))
+        for name in names if name in query
+    )
+
+# Filters the browse sidebar shows counts for; the rest narrow every facet
+PET_FACET_PARAMS = ('category', 'location', 'ages[]', 'locations[]')
+
+def pet_facet_query(query):
+    """Build the (sql, params) that groups the non-facet matches for the facets"""
+    base = {name: values for name, values in query.items() if name not in PET_FACET_PARAMS}
+    if uses_summary_filters(base):
+        # The groups are exactly the rows of pet_counts
+        return '''
+            SELECT species, location, age, available, min_price, max_price
+            FROM pet_counts WHERE available > 0
+        ''', []
+    where_clause, params = build_pet_filters(base)
+    sql = f'''
+        SELECT species, location, age, COUNT(*), MIN(price), MAX(price)
+        FROM pets WHERE {where_clause}
+        GROUP BY species, location, age
+    '''
+    return sql, params
+
+def pet_facet_counts(conn, query):
+    """Count available pets per species, location and age bucket in one query
+
+    Each facet is counted with every filter applied except its own, so with
+    one location ticked the other locations still show what they would add.
+    The rows are grouped by (species, location, age), which stays small, and
+    the facet filters are applied to the groups here.
+    """
+    rows = conn.execute(*pet_facet_query(query)).fetchall()
+    
+    category = query.get('category', ['all'])[0]
+    location = query.get('location', [''])[0]
+    locations = set(query.get('locations[]', []))
+    ages = set(query.get('ages[]', [])) & {label for label, low, high in AGE_BUCKETS}
+    
+    species_counts = {}
+    location_counts = {}
+    age_counts = {label: 0 for label, low, high in AGE_BUCKETS}
+    total = 0
+    min_price = max_price = None
+    
+    for species, pet_location, age, count, low_price, high_price in rows:
+        buckets = age_bucket_labels(age)
+        species_ok = category == 'all' or species == category
+        location_ok = (not location or pet_location == location) and (not locations or pet_location in locations)
+        age_ok = not ages or not ages.isdisjoint(buckets)
+        
+        if location_ok and age_ok:
+            species_counts[species] = species_counts.get(species, 0) + count
+        if species_ok and age_ok:
+            location_counts[pet_location] = location_counts.get(pet_location, 0) + count
+        if species_ok and location_ok:
+            for label in buckets:
+                age_counts[label] += count
+        if species_ok and location_ok and age_ok:
+            total += count
+            min_price = low_price if min_price is None else min(min_price, low_price)
+            max_price = high_price if max_price is None else max(max_price, high_price)
+    
+    return {
+        'total': total,
+        'species': species_counts,
+        'locations': location_counts,
+        'ages': age_counts,
+        'price': {'min': min_price, 'max': max_price}
+    }
+
+SESSION_TTL = 7 * 24 * 3600
+
+class SessionRevocations:
+    """Recently ended session ids in shared memory, seen by every prefork worker
+
+    A logout appends its session id to a ring created before any fork.
+    Before trusting its session cache, each worker drops the ids appended
+    since it last looked, so a logout ends that one session in every worker
+    at once and leaves the other cached sessions alone. A worker that has
+    fallen a whole ring behind clears its cache instead.
+    """
+    size = 1024
+    width = 64
+
+    def __init__(self):
+        self._ids = multiprocessing.Array('c', self.size * self.width, lock=False)
+        self._count = multiprocessing.Value('Q', 0)
+        self._seen = 0
+        self._lock = threading.Lock()
+
+    def position(self):
+        return self._count.value
+
+    def revoke(self, session_id):
+        data = session_id.encode('utf-8')
+        with self._count.get_lock():
+            if len(data) > self.width:
+                # Can't be recorded; jumping a whole ring makes every worker clear
+                self._count.value += self.size
+                return
+            start = self._count.value % self.size * self.width
+            self._ids[start:start + self.width] = data.ljust(self.width, b'\0')
+            self._count.value += 1
+
+    def apply(self, cache):
+        """Drop the sessions ended since the last call from cache"""
+        if self._count.value == self._seen:
+            return
+        with self._lock:
+            count = self._count.value
+            if count - self._seen < self.size:
+                for number in range(self._seen, count):
+                    start = number % self.size * self.width
+                    cache.pop(self._ids[start:start + self.width].rstrip(b'\0').decode('utf-8'))
+            # Slots read above may have been reused while this ran
+            if self._count.value - self._seen >= self.size:
+                cache.clear()
+            self._seen = count
+
+session_revocations = SessionRevocations()
+
+# (user, session expiry) by session_id. Each process has its own cache;
+# the TTL bounds how long a logout made by a separate server on the same
+# database can take to be seen here.
+session_cache = LRUCache(maxsize=10000, ttl=60)
+
+def session_id_from_cookie(cookies):
+    """The session_id value from a Cookie header, or None"""
+    for cookie in cookies.split(';'):
+        if cookie.strip().startswith('session_id='):
+            return cookie.split('=')[1].strip()
+    return None
+
+def session_user(session_id):
+    """The user a live session belongs to, from session_cache when possible, or None"""
+    now = int(time.time())
+    session_revocations.apply(session_cache)
+    cached = session_cache.get(session_id)
+    if cached is not None:
+        user, expires_at = cached
+        if expires_at > now:
+            return dict(user)
+        session_cache.pop(session_id)
+    # A logout landing while the database is read must not be cached over
+    revocations = session_revocations.position()
+    
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT u.id, u.name, u.email, s.expires_at FROM users u
+            JOIN sessions s ON u.id = s.user_id
+            WHERE s.session_id = ? AND s.expires_at > ?
+        ''', (session_id, now))
+        result = cursor.fetchone()
+    
+    if result:
+        user = {'id': result[0], 'name': result[1], 'email': result[2]}
+        if session_revocations.position() == revocations:
+            session_cache.set(session_id, (user, result[3]))
+        return dict(user)
+    return None
+
+class Histogram:
+    """Latency histogram with fixed upper bounds, in the Prometheus layout"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def add(self, other):
+        """Fold in another histogram with the same buckets"""
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+@functools.lru_cache(maxsize=2048)
+def sql_shape(sql):
+    """Collapse a statement to its shape so filter combinations group sensibly
+
+    Whitespace and literals are normalized, and repeated placeholders or
+    OR-ed conditions (one per ticked checkbox) count as one.
+    """
+    shape = ' '.join(sql.split())
+    shape = re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", '?', shape)
+    shape = re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', shape)
+    shape = re.sub(r'(\b[\w.]+ (?:=|BETWEEN \? AND|>=) \?)(?: OR [\w.]+ (?:=|BETWEEN \? AND|>=) \?)+',
+                   r'\1 OR ...', shape)
+    return shape
+
+class Metrics:
+    """Request, SQL and byte counters, rendered as Prometheus text
+
+    Observations are a dict lookup and a few additions under one lock, cheap
+    enough to leave on. In prefork mode each worker also writes its counters
+    to a shared directory every publish_interval seconds, and a scrape adds
+    up the latest copy from every worker. A worker that has exited keeps
+    its file, so the totals never go down.
+    """
+    publish_interval = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}
+        self.responses = {}
+        self.bytes_in = {}
+        self.bytes_out = {}
+        self.sql = {}
+        # Set by run_prefork before forking
+        self.shared_dir = None
+        # Bearer token for scrapers, from --metrics-token
+        self.token = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def observe_request(self, method, route, status, seconds, bytes_in, bytes_out):
+        key = (method, route)
+        with self._lock:
+            histogram = self.requests.get(key)
+            if histogram is None:
+                histogram = self.requests[key] = Histogram(REQUEST_BUCKETS)
+            histogram.observe(seconds)
+            status_key = (method, route, status)
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+            self.bytes_in[key] = self.bytes_in.get(key, 0) + bytes_in
+            self.bytes_out[key] = self.bytes_out.get(key, 0) + bytes_out
+
+    def observe_sql(self, sql, seconds):
+        shape = sql_shape(sql)
+        with self._lock:
+            histogram = self.sql.get(shape)
+            if histogram is None:
+                histogram = self.sql[shape] = Histogram(SQL_BUCKETS)
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """Copy of this process's counters, cache lookups included"""
+        with self._lock:
+            state = copy.deepcopy({
+                'requests': self.requests,
+                'responses': self.responses,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'sql': self.sql,
+            })
+        state['caches'] = {}
+        for cache_name, cache in (('listing', pet_listing_cache), ('count', pet_count_cache),
+                                  ('session', session_cache)):
+            stats = cache.stats()
+            state['caches'][cache_name] = {'hit': stats['hits'], 'miss': stats['misses']}
+        return state
+
+    def start(self):
+        if self.shared_dir is None or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-publisher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self.publish()
+
+    def _run(self):
+        while not self._stop.wait(self.publish_interval):
+            self.publish()
+
+    def publish(self):
+        """Write this worker's counters for the other workers to read"""
+        path = os.path.join(self.shared_dir, f'{os.getpid()}.pickle')
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"Publishing metrics failed: {e}")
+
+    def collect(self):
+        """This process's live counters added to the other workers' latest copies"""
+        total = self.snapshot()
+        if self.shared_dir is None:
+            return total
+        own = f'{os.getpid()}.pickle'
+        for name in os.listdir(self.shared_dir):
+            if not name.endswith('.pickle') or name == own:
                 continue
-                
-            # Split headers and content
-            header_end = part.find(b'\r\n\r\n')
-            if header_end == -1:
+            try:
+                with open(os.path.join(self.shared_dir, name), 'rb') as f:
+                    state = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
                 continue
-                
-            headers = part[:header_end].decode('utf-8')
-            content = part[header_end + 4:]
+            for section in ('requests', 'sql'):
+                for key, histogram in state[section].items():
+                    if key in total[section]:
+                        total[section][key].add(histogram)
+                    else:
+                        total[section][key] = histogram
+            for section in ('responses', 'bytes_in', 'bytes_out'):
+                for key, value in state[section].items():
+                    total[section][key] = total[section].get(key, 0) + value
+            for cache_name, results in state['caches'].items():
+                for result, value in results.items():
+                    total['caches'][cache_name][result] += value
+        return total
+
+    def render(self):
+        state = self.collect()
+        lines = []
+
+        def labels(**values):
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                       for value in values.values())
+            return '{' + ','.join(f'{name}="{value}"' for name, value in zip(values, escaped)) + '}'
+
+        def histogram_lines(name, histogram, **values):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{labels(**values, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{labels(**values)} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{labels(**values)} {histogram.count}')
+
+        lines.append('# HELP petcenter_http_request_duration_seconds Time to handle a request, by route pattern')
+        lines.append('# TYPE petcenter_http_request_duration_seconds histogram')
+        for (method, route), histogram in sorted(state['requests'].items()):
+            histogram_lines('petcenter_http_request_duration_seconds', histogram, method=method, route=route)
+        lines.append('# HELP petcenter_http_responses_total Responses by route pattern and status code')
+        lines.append('# TYPE petcenter_http_responses_total counter')
+        for (method, route, status), count in sorted(state['responses'].items()):
+            lines.append(f'petcenter_http_responses_total{labels(method=method, route=route, status=status)} {count}')
+        for name, section, help_text in (
+            ('petcenter_http_request_bytes_total', 'bytes_in', 'Request body bytes received'),
+            ('petcenter_http_response_bytes_total', 'bytes_out', 'Response bytes sent, headers included')
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (method, route), total in sorted(state[section].items()):
+                lines.append(f'{name}{labels(method=method, route=route)} {total}')
+        lines.append('# HELP petcenter_sql_duration_seconds Time in cursor.execute, by statement shape')
+        lines.append('# TYPE petcenter_sql_duration_seconds histogram')
+        for shape, histogram in sorted(state['sql'].items()):
+            histogram_lines('petcenter_sql_duration_seconds', histogram, query=shape)
+
+        lines.append('# HELP petcenter_cache_lookups_total Response and session cache lookups')
+        lines.append('# TYPE petcenter_cache_lookups_total counter')
+        for cache_name, results in state['caches'].items():
+            for result, value in results.items():
+                lines.append(f'petcenter_cache_lookups_total{labels(cache=cache_name, result=result)} {value}')
+        lines.append('# HELP petcenter_process_start_time_seconds Unix time the server started')
+        lines.append('# TYPE petcenter_process_start_time_seconds gauge')
+        lines.append(f'petcenter_process_start_time_seconds {self.started:.3f}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+# Trigger-maintained summaries small enough that reading them whole is the point
+SUMMARY_TABLES = {'pet_counts'}
+
+def is_full_scan(detail):
+    """Whether an EXPLAIN QUERY PLAN detail reads a whole table
+
+    "SCAN <table>" with no index is a full table scan; searches and
+    index-ordered scans are fine, as are scans of SUMMARY_TABLES.
+    """
+    return (detail.startswith('SCAN ') and 'INDEX' not in detail
+            and detail.split()[1] not in SUMMARY_TABLES)
+
+def redact_params(parameters):
+    """Parameter types without their values, safe to log"""
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+class SlowQueryLog:
+    """Statements slower than a threshold, grouped by shape
+
+    Each slow statement is printed with its shape and redacted parameters.
+    The first time a shape is slow its EXPLAIN QUERY PLAN is captured on
+    the same connection, so the admin endpoint can show which ones scan.
+    Entries are per process.
+    """
+
+    def __init__(self, threshold_ms=100, max_shapes=500):
+        self.threshold = threshold_ms / 1000
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def record(self, conn, sql, parameters, seconds):
+        shape = sql_shape(sql)
+        redacted = redact_params(parameters) if parameters is not None else None
+        print(f"Slow query ({seconds * 1000:.1f} ms): {shape} params={redacted}", flush=True)
+        with self._lock:
+            entry = self._entries.get(shape)
+            if entry is None:
+                if len(self._entries) >= self.max_shapes:
+                    return
+                entry = self._entries[shape] = {
+                    'query': shape, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'plan': None
+                }
+                explain = True
+            else:
+                explain = False
+            entry['count'] += 1
+            entry['total_ms'] += seconds * 1000
+            entry['max_ms'] = max(entry['max_ms'], seconds * 1000)
+            entry['last_seen'] = datetime.now().isoformat(timespec='seconds')
+            entry['params'] = redacted
+        
+        if explain and parameters is not None:
+            plan = self.explain(conn, sql, parameters)
+            with self._lock:
+                entry['plan'] = plan
+                entry['full_scan'] = any(is_full_scan(detail) for detail in plan or [])
+
+    def explain(self, conn, sql, parameters):
+        if not re.match(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', sql, re.I):
+            return None
+        try:
+            # A plain cursor, so the EXPLAIN is neither timed nor logged itself
+            cursor = conn.cursor(sqlite3.Cursor)
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters)
+            return [row[3] for row in cursor.fetchall()]
+        except sqlite3.Error:
+            return None
+
+    def top(self, limit=20):
+        """The shapes with the most total slow time"""
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        entries.sort(key=lambda entry: entry['total_ms'], reverse=True)
+        for entry in entries:
+            entry['total_ms'] = round(entry['total_ms'], 3)
+            entry['max_ms'] = round(entry['max_ms'], 3)
+            entry['mean_ms'] = round(entry['total_ms'] / entry['count'], 3)
+        return entries[:limit]
+
+# Threshold set from --slow-query-ms
+slow_queries = SlowQueryLog()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each execute for metrics and the slow query log
+
+    SQLite runs a statement up to its first row inside execute, which is
+    where sorting and grouping happen; later fetches are not timed.
+    """
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe_sql(sql, elapsed)
+            if elapsed >= slow_queries.threshold:
+                slow_queries.record(self.connection, sql, parameters, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe_sql(sql, elapsed)
+            # The parameters may be a spent iterator, so there is no plan
+            if elapsed >= slow_queries.threshold:
+                slow_queries.record(self.connection, sql, None, elapsed)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including conn.execute shortcuts, are timed"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class CountingWriter:
+    """Wraps a handler's wfile and counts the bytes written through it"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self.wfile.write(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+class BodyReader:
+    """Wraps a handler's rfile so reads stop at the end of the request body
+
+    remaining is what the handler left unread; on a kept-alive connection
+    it has to be skipped before the next request line.
+    """
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if not size:
+            return b''
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        return data
+
+class AccessLog:
+    """One JSON object per request, appended to a file or stdout"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = sys.stdout if path == '-' else open(path, 'a', buffering=1)
+
+    def write(self, handler, route, seconds, bytes_in, bytes_out):
+        entry = json.dumps({
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'client': handler.client_address[0] if handler.client_address else None,
+            'method': handler.command,
+            'path': handler.path,
+            'route': route,
+            'status': handler.status,
+            'duration_ms': round(seconds * 1000, 3),
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+            'user_agent': handler.headers.get('User-Agent')
+        })
+        with self._lock:
+            self._file.write(entry + '\n')
+
+# Set from --access-log
+access_log = None
+
+class ConnectionPool:
+    """Fixed-size pool of pre-configured SQLite connections
+
+    Connections are opened lazily, configured once, and handed out with
+    ``with db_pool.connection() as conn``. A thread that already holds a
+    connection gets the same one back, so nested helpers such as
+    get_current_user never take a second connection for one request.
+    """
+
+    def __init__(self, path, size=16, timeout=30, busy_timeout_ms=5000,
+                 cache_size_kb=16384, mmap_size=256 * 1024 * 1024):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False, factory=InstrumentedConnection)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        # Negative cache_size is in KiB rather than pages
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def _checkout(self):
+        with self._lock:
+            # Connections must never cross a fork; each prefork worker
+            # builds its own pool
+            if self._pid != os.getpid():
+                self._reset()
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError('Timed out waiting for a database connection')
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            # Never hand the next request a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+db_pool = ConnectionPool('pets.db')
+
+class SessionSweeper:
+    """Background thread that deletes expired sessions
+
+    Rows go in batches of batch_size, each its own short transaction, so a
+    sweep never holds the write lock long enough to stall a login. The
+    expires_at index makes each batch a range read. In prefork mode every
+    worker sweeps; the deletes are idempotent and the start is jittered.
+    """
+
+    def __init__(self, interval=300, batch_size=500):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        delay = self.interval * (0.5 + os.urandom(1)[0] / 512)
+        while not self._stop.wait(delay):
+            try:
+                self.sweep()
+            except sqlite3.Error as e:
+                print(f"Session sweep failed: {e}")
+            delay = self.interval
+
+    def sweep(self, now=None):
+        """Delete every session expired at now (epoch seconds); returns the count"""
+        now = int(time.time()) if now is None else now
+        deleted = 0
+        while not self._stop.is_set():
+            with db_pool.connection() as conn:
+                cursor = conn.execute('''
+                    DELETE FROM sessions WHERE id IN (
+                        SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?
+                    )
+                ''', (now, self.batch_size))
+                conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < self.batch_size:
+                break
+            # Let queued writers in between batches
+            time.sleep(0.01)
+        return deleted
+
+session_sweeper = SessionSweeper()
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that serves each connection on a bounded pool of worker threads
+
+    Between requests a keep-alive connection gives its worker back and is
+    parked on a selector thread. It returns to the pool when its next
+    request arrives and is closed after keepalive_timeout idle seconds, so
+    idle browsers never hold workers that other clients are waiting for.
+    """
+    request_queue_size = 128
+    keepalive_timeout = 5
+
+    def __init__(self, server_address, handler_class, threads=16):
+        super().__init__(server_address, handler_class)
+        self.threads = threads
+        self._slots = threading.BoundedSemaphore(threads)
+        self._executor = None
+        self.stopping = threading.Event()
+        # Idle connections by socket as (client_address, requests served,
+        # deadline). All share one timeout, so the oldest come first.
+        self._parked = OrderedDict()
+        self._to_park = queue.SimpleQueue()
+        self._selector = None
+        self._selector_thread = None
+        self._wakeup = None
+
+    def shutdown(self):
+        self.stopping.set()
+        self._wake()
+        super().shutdown()
+
+    def process_request(self, request, client_address, served=0):
+        # Block the accept loop while every worker is busy so new connections
+        # wait in the listen backlog instead of piling up in memory
+        self._slots.acquire()
+        if self._executor is None:
+            # Created lazily so no threads exist yet when prefork mode forks
+            self._executor = ThreadPoolExecutor(max_workers=self.threads,
+                                                thread_name_prefix='http-worker')
+            self._selector = selectors.DefaultSelector()
+            self._wakeup = socket.socketpair()
+            self._selector.register(self._wakeup[0], selectors.EVENT_READ)
+            self._selector_thread = threading.Thread(target=self._watch_idle, name='http-idle', daemon=True)
+            self._selector_thread.start()
+        self._executor.submit(self._process_request_worker, request, client_address, served)
+
+    def _process_request_worker(self, request, client_address, served):
+        handler = None
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self, served)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self._slots.release()
+            if handler is not None and handler.idle:
+                self.park(request, client_address, handler.requests_served)
+            else:
+                self.shutdown_request(request)
+
+    def park(self, request, client_address, served):
+        """Hold an idle keep-alive connection without a worker until it sends again"""
+        if self.stopping.is_set():
+            self.shutdown_request(request)
+            return
+        self._to_park.put((request, client_address, served))
+        self._wake()
+
+    def _wake(self):
+        if self._wakeup is not None:
+            try:
+                self._wakeup[1].send(b'\0')
+            except OSError:
+                pass
+
+    def _watch_idle(self):
+        """Selector thread: resubmit parked connections that send, close those that idle out"""
+        while not self.stopping.is_set():
+            timeout = None
+            if self._parked:
+                deadline = next(iter(self._parked.values()))[2]
+                timeout = max(deadline - time.monotonic(), 0)
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._wakeup[0]:
+                    self._wakeup[0].recv(4096)
+                    continue
+                request = key.fileobj
+                self._selector.unregister(request)
+                client_address, served, _ = self._parked.pop(request)
+                # Waits for a free worker like a new connection would
+                try:
+                    self.process_request(request, client_address, served)
+                except RuntimeError:
+                    # The pool shut down while this waited for a worker
+                    self._slots.release()
+                    self.shutdown_request(request)
             
-            # Remove trailing \r\n
-            if content.endswith(b'\r\n'):
-                content = content[:-2]
+            while not self._to_park.empty():
+                request, client_address, served = self._to_park.get()
+                self._parked[request] = (client_address, served, time.monotonic() + self.keepalive_timeout)
+                self._selector.register(request, selectors.EVENT_READ)
+            
+            now = time.monotonic()
+            while self._parked:
+                request, (_, _, deadline) = next(iter(self._parked.items()))
+                if deadline > now:
+                    break
+                del self._parked[request]
+                self._selector.unregister(request)
+                self.shutdown_request(request)
+        self._close_parked()
+
+    def _close_parked(self):
+        for request in list(self._parked):
+            self._selector.unregister(request)
+            self.shutdown_request(request)
+        self._parked.clear()
+        while not self._to_park.empty():
+            self.shutdown_request(self._to_park.get()[0])
+
+    def drain(self):
+        """Wait for in-flight requests once serve_forever has returned"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._selector_thread.join()
+            # Anything parked by the last requests after the selector stopped
+            self._close_parked()
+            self._selector.close()
+            for sock in self._wakeup:
+                sock.close()
+        self.server_close()
+
+class StreamWriterFile:
+    """Blocking file object a worker thread uses to write to an asyncio stream
+
+    Writes are buffered and handed to the event loop in 64 KiB pieces; each
+    hand-off waits for the transport to drain, so a slow client slows the
+    worker instead of filling memory.
+    """
+
+    def __init__(self, loop, writer, buffer_size=64 * 1024):
+        self._loop = loop
+        self._writer = writer
+        self._buffer = bytearray()
+        self.buffer_size = buffer_size
+        self.head = None
+
+    def write(self, data):
+        # end_headers writes the whole response head in one call
+        if self.head is None:
+            self.head = bytes(data).split(b'\r\n\r\n', 1)[0]
+        self._buffer += data
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        asyncio.run_coroutine_threadsafe(self._send(data), self._loop).result()
+
+    async def _send(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+    def framed(self):
+        """True when the client can find the end of the response without a close"""
+        if self.head is None:
+            return False
+        status = self.head.split(b' ', 2)[1:2]
+        return (status in ([b'204'], [b'304'])
+                or re.search(rb'\r\ncontent-length[ \t]*:', self.head, re.I) is not None
+                or re.search(rb'\r\ntransfer-encoding[ \t]*:[ \t]*chunked', self.head, re.I) is not None)
+
+class AsyncHTTPServer:
+    """HTTP/1.1 server on an asyncio event loop that runs the same handler class
+
+    The loop owns the sockets, so idle keep-alive connections cost no thread.
+    Each request is read in full first (bodies spill to a temp file past
+    1 MiB) and then run by handler_class on a bounded thread pool, where the
+    blocking SQLite and file work happens. Pipelined requests wait in the
+    stream buffer and are answered in order.
+    """
+    request_queue_size = 1024
+    max_header_size = 64 * 1024
+    # Bodies are spooled to disk before routing, so the limit holds for
+    # anonymous clients too; signed-in imports may send MAX_IMPORT_UPLOAD_SIZE
+    max_body_size = 32 * 1024 * 1024
+    keepalive_timeout = 15
+
+    def __init__(self, server_address, handler_class, threads=16):
+        self.server_address = server_address
+        self.handler_class = handler_class
+        self.threads = threads
+        self.socket = socket.create_server(server_address, backlog=self.request_queue_size)
+        self._executor = None
+        self._loop = None
+        self._stopping = None
+        self._connections = set()
+        self._idle = set()
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    def shutdown(self):
+        """Stop accepting and close idle connections; callable from any thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    def drain(self):
+        """Release the worker threads once serve_forever has returned"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self.server_close()
+
+    def server_close(self):
+        self.socket.close()
+
+    async def _serve(self):
+        self._stopping = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads,
+                                            thread_name_prefix='http-worker')
+        server = await asyncio.start_server(self._handle_connection, sock=self.socket,
+                                            limit=self.max_header_size)
+        await self._stopping.wait()
+        
+        # Busy connections finish their current request and then close
+        server.close()
+        for task in list(self._idle):
+            task.cancel()
+        if self._connections:
+            await asyncio.gather(*self._connections, return_exceptions=True)
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        client_address = writer.get_extra_info('peername')
+        served = 0
+        try:
+            while not self._stopping.is_set():
+                self._idle.add(task)
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                                                  self.keepalive_timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        asyncio.TimeoutError, ConnectionError):
+                    break
+                finally:
+                    self._idle.discard(task)
+                
+                request = await self._read_request(reader, writer, head)
+                if request is None:
+                    break
+                served += 1
+                keep_alive = await self._loop.run_in_executor(
+                    self._executor, self._run_handler, request, writer, client_address, served)
+                if not keep_alive:
+                    break
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _read_request(self, reader, writer, head):
+        """Return the request head and body as one spooled file, or None to close"""
+        if re.search(rb'\r\ntransfer-encoding[ \t]*:', head, re.I):
+            await self._send_status(writer, 411, 'Length Required')
+            return None
+        match = re.search(rb'\r\ncontent-length[ \t]*:[ \t]*(\d+)[ \t]*\r\n', head, re.I)
+        remaining = int(match.group(1)) if match else 0
+        if remaining > self.max_body_size and (remaining > MAX_IMPORT_UPLOAD_SIZE
+                                               or not await self._signed_in_import(head)):
+            await self._send_status(writer, 413, 'Content Too Large')
+            return None
+        if remaining and re.search(rb'\r\nexpect[ \t]*:[ \t]*100-continue', head, re.I):
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        
+        request = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        request.write(head)
+        try:
+            while remaining:
+                chunk = await asyncio.wait_for(reader.read(min(remaining, 64 * 1024)),
+                                               self.keepalive_timeout)
+                if not chunk:
+                    raise ConnectionError('client closed mid-body')
+                request.write(chunk)
+                remaining -= len(chunk)
+        except (asyncio.TimeoutError, ConnectionError):
+            request.close()
+            return None
+        request.seek(0)
+        return request
+
+    async def _signed_in_import(self, head):
+        """Whether head is a bulk import from a live session, which may carry a larger body"""
+        if not re.match(rb'POST /api/import-pets[ ?]', head):
+            return False
+        match = re.search(rb'\r\ncookie[ \t]*:([^\r\n]*)', head, re.I)
+        session_id = session_id_from_cookie(match.group(1).decode('latin-1')) if match else None
+        if not session_id:
+            return False
+        # The session lookup may hit SQLite, so it runs on a worker thread
+        user = await self._loop.run_in_executor(self._executor, session_user, session_id)
+        return user is not None
+
+    async def _send_status(self, writer, status, reason):
+        writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\n'
+                     'Connection: close\r\n\r\n'.encode('latin-1'))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def _run_handler(self, request, writer, client_address, served=1):
+        """Run one request through handler_class on a worker thread
+
+        served counts requests on the connection, this one included.
+        Returns whether the connection can carry another request.
+        """
+        wfile = StreamWriterFile(self._loop, writer)
+        # Skip StreamRequestHandler's socket setup; the request is already read
+        handler = self.handler_class.__new__(self.handler_class)
+        handler.server = self
+        handler.client_address = client_address
+        handler.request = handler.connection = None
+        handler.rfile = request
+        handler.wfile = wfile
+        handler.protocol_version = 'HTTP/1.1'
+        handler.close_connection = True
+        handler.requests_served = served
+        handler.handle_expect_100 = lambda: True
+        try:
+            handler.handle_one_request()
+            wfile.flush()
+        except ConnectionError:
+            return False
+        except Exception:
+            print(f'Exception occurred during processing of request from {client_address}')
+            traceback.print_exc()
+            return False
+        finally:
+            request.close()
+        # A response without a length is delimited by closing the connection
+        return not handler.close_connection and wfile.framed()
+
+def parse_byte_range(header, size):
+    """Parse a single-range Range header into inclusive (start, end)
+
+    Returns None when the header should be ignored (malformed, another unit,
+    or several ranges) and raises ValueError when no byte of the file falls
+    inside the range.
+    """
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', header)
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError('Range starts past the end of the file')
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against an ETag"""
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in candidates)
+
+def negotiate_encoding(accept_encoding, available):
+    """Pick the best content coding in available that the client accepts"""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.partition(';')
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        try:
+            quality = float(match.group(1)) if match else 1.0
+        except ValueError:
+            quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+class CompressedBody:
+    """A serialized JSON response and its gzip/brotli forms, each made once on demand
+
+    The listing cache holds these, so repeat hits reuse the compressed bytes
+    instead of compressing again. Levels are moderate because, unlike
+    static assets, API bodies are compressed while the client waits.
+    """
+    # Below this the headers outweigh the saving
+    min_size = 1024
+    gzip_level = 6
+    brotli_quality = 5
+
+    def __init__(self, content):
+        self.content = content
+        self._variants = {'identity': content}
+
+    @functools.cached_property
+    def etag(self):
+        return '"' + hashlib.sha256(self.content).hexdigest()[:16] + '"'
+
+    @property
+    def encodings(self):
+        """Codings worth offering for this body"""
+        if len(self.content) < self.min_size:
+            return ()
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def encode(self, encoding):
+        body = self._variants.get(encoding)
+        if body is None:
+            if encoding == 'br':
+                body = brotli.compress(self.content, quality=self.brotli_quality)
+            else:
+                body = gzip.compress(self.content, compresslevel=self.gzip_level, mtime=0)
+            # Two threads may both compress a fresh body; either result will do
+            self._variants[encoding] = body
+        return body
+
+class StreamCompressor:
+    """Incremental gzip or brotli for a body whose length isn't known up front"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=CompressedBody.brotli_quality)
+            self.compress, self.flush = compressor.process, compressor.finish
+        elif encoding == 'gzip':
+            # wbits 31 writes the gzip header and trailer
+            compressor = zlib.compressobj(CompressedBody.gzip_level, zlib.DEFLATED, 31)
+            self.compress, self.flush = compressor.compress, compressor.flush
+        else:
+            self.compress, self.flush = bytes, bytes
+
+class StaticAsset:
+    """One file held in memory with its precompressed variants"""
+
+    def __init__(self, filename, content_type, content, mtime_ns, dependencies):
+        self.filename = filename
+        self.content_type = content_type
+        self.mtime_ns = mtime_ns
+        self.dependencies = dependencies
+        self.fingerprint = hashlib.sha256(content).hexdigest()[:12]
+        # encoding -> (body, strong ETag)
+        self.variants = {'identity': (content, f'"{self.fingerprint}"')}
+        
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) < len(content):
+            self.variants['gzip'] = (compressed, f'"{self.fingerprint}-gz"')
+        if brotli is not None:
+            compressed = brotli.compress(content, quality=11)
+            if len(compressed) < len(content):
+                self.variants['br'] = (compressed, f'"{self.fingerprint}-br"')
+
+class AssetCache:
+    """Pages, CSS and JS loaded and compressed once, reloaded when they change
+
+    CSS and JS are also reachable under fingerprinted names such as
+    /style.<hash>.css that can be cached forever. Pages are rewritten to
+    reference those names, so a changed stylesheet gets a new URL.
+    """
+    fingerprinted_path = re.compile(r'/(\w+)\.([0-9a-f]{12})\.(css|js)')
+
+    def __init__(self, assets, check_interval=2.0):
+        # filename -> content type
+        self.assets = assets
+        self.check_interval = check_interval
+        self._loaded = {}
+        self._checked_at = {}
+        # Reentrant: loading a page loads the assets it links to
+        self._lock = threading.RLock()
+
+    def preload(self):
+        for filename in self.assets:
+            self.get(filename)
+
+    def get(self, filename):
+        """Return the current StaticAsset for filename, or None if it doesn't exist"""
+        if filename not in self.assets:
+            return None
+        asset = self._loaded.get(filename)
+        now = time.monotonic()
+        if asset is not None and now - self._checked_at.get(filename, 0) < self.check_interval:
+            return asset
+        
+        with self._lock:
+            self._checked_at[filename] = now
+            try:
+                mtime_ns = os.stat(filename).st_mtime_ns
+            except OSError:
+                self._loaded.pop(filename, None)
+                return None
+            asset = self._loaded.get(filename)
+            if asset is None or asset.mtime_ns != mtime_ns or self._dependencies_changed(asset):
+                asset = self._load(filename, mtime_ns)
+                self._loaded[filename] = asset
+            return asset
+
+    def fingerprinted_url(self, filename):
+        asset = self.get(filename)
+        if asset is None:
+            return filename
+        stem, ext = os.path.splitext(filename)
+        return f'/{stem}.{asset.fingerprint}{ext}'
+
+    def resolve(self, path):
+        """Map a fingerprinted path to (filename, fingerprint), or None"""
+        match = self.fingerprinted_path.fullmatch(path)
+        if not match:
+            return None
+        filename = f'{match.group(1)}.{match.group(3)}'
+        return (filename, match.group(2)) if filename in self.assets else None
+
+    def _dependencies_changed(self, asset):
+        for filename, fingerprint in asset.dependencies.items():
+            current = self.get(filename)
+            if current is not None and current.fingerprint != fingerprint:
+                return True
+        return False
+
+    def _load(self, filename, mtime_ns):
+        with open(filename, 'rb') as f:
+            content = f.read()
+        
+        dependencies = {}
+        if self.assets[filename] == 'text/html':
+            # Point pages at the fingerprinted CSS/JS
+            def rewrite(match):
+                referenced = match.group(2)
+                url = self.fingerprinted_url(referenced)
+                if url == referenced:
+                    return match.group(0)
+                dependencies[referenced] = self.get(referenced).fingerprint
+                return f'{match.group(1)}="{url}"'
             
-            # Parse Content-Disposition header
-            name = None
-            filename = None
-            for line in headers.split('\r\n'):
-                if line.startswith('Content-Disposition:'):
-                    parts = line.split(';')
-                    for p in parts:
-                        p = p.strip()
-                        if p.startswith('name="'):
-                            name = p[6:-1]
-                        elif p.startswith('filename="'):
-                            filename = p[10:-1]
+            linkable = '|'.join(re.escape(name) for name, content_type in self.assets.items()
+                                if content_type != 'text/html')
+            html = content.decode('utf-8')
+            content = re.sub(rf'(href|src)="/?({linkable})"', rewrite, html).encode('utf-8')
+        
+        return StaticAsset(filename, self.assets[filename], content, mtime_ns, dependencies)
+
+asset_cache = AssetCache({
+    'style.css': 'text/css',
+    'script.js': 'application/javascript',
+    'index.html': 'text/html',
+    'login.html': 'text/html',
+    'signup.html': 'text/html',
+    'dashboard.html': 'text/html',
+})
+
+# Resized copies of uploaded photos as name -> bounding box in pixels
+IMAGE_VARIANTS = {
+    'thumb': (400, 300),
+    'medium': (1024, 768),
+}
+
+def image_variant_urls(image):
+    """Variant URLs for an uploaded image path, or None for external images"""
+    match = re.fullmatch(r'uploads[\\/]([0-9a-f-]{36})\.\w+', image or '')
+    if not match:
+        return None
+    return {size: f'/uploads/{match.group(1)}/{size}' for size in IMAGE_VARIANTS}
+
+class ImagePipeline:
+    """Generates JPEG and WebP variants of uploaded photos on a worker pool
+
+    Variants are written to uploads/<id>/<size>.jpg and .webp. Donations
+    queue them up front; a variant that is requested but missing is made
+    on the spot. Without Pillow no variants exist and callers fall back to
+    the original file.
+    """
+    formats = {
+        'webp': ('WEBP', {'quality': 80, 'method': 4}),
+        'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    }
+
+    def __init__(self, upload_dir='uploads', workers=2):
+        self.upload_dir = upload_dir
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    def submit(self, original_path):
+        """Queue every variant of a freshly uploaded photo"""
+        if not self.enabled:
+            return
+        image_id = os.path.splitext(os.path.basename(original_path))[0]
+        with self._lock:
+            # Created lazily so no threads exist yet when prefork mode forks
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='image-worker')
+        for size in IMAGE_VARIANTS:
+            self._executor.submit(self._generate_logged, original_path, image_id, size)
+
+    def drain(self):
+        """Wait for every queued variant to be written"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def original_path(self, image_id):
+        matches = glob.glob(os.path.join(self.upload_dir, glob.escape(image_id) + '.*'))
+        return matches[0] if matches else None
+
+    def variant_path(self, image_id, size, ext):
+        return os.path.join(self.upload_dir, image_id, f'{size}.{ext}')
+
+    def ensure(self, image_id, size, ext):
+        """Path of a variant, generating it now if missing; None if impossible"""
+        path = self.variant_path(image_id, size, ext)
+        if os.path.exists(path):
+            return path
+        original = self.original_path(image_id)
+        if not self.enabled or original is None:
+            return None
+        try:
+            self._generate(original, image_id, size)
+        except Exception as e:
+            print(f"Error resizing {original}: {e}")
+            return None
+        return path
+
+    def _generate_logged(self, original_path, image_id, size):
+        try:
+            self._generate(original_path, image_id, size)
+        except Exception as e:
+            print(f"Error resizing {original_path}: {e}")
+
+    def _generate(self, original_path, image_id, size):
+        directory = os.path.join(self.upload_dir, image_id)
+        os.makedirs(directory, exist_ok=True)
+        with Image.open(original_path) as image:
+            # Phone photos are often stored sideways with an EXIF rotation
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(IMAGE_VARIANTS[size])
+            image = image.convert('RGB')
+            for ext, (image_format, options) in self.formats.items():
+                # Write then rename so readers never see a partial file
+                temp_path = os.path.join(directory, f'.{size}.{ext}.{uuid.uuid4().hex}')
+                image.save(temp_path, image_format, **options)
+                os.replace(temp_path, self.variant_path(image_id, size, ext))
+
+image_pipeline = ImagePipeline()
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+MAX_IMPORT_UPLOAD_SIZE = 512 * 1024 * 1024
+
+class ImportArchive:
+    """The zip or tar of photos that comes with a bulk import"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        if zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+            self._tar = None
+            members = {info.filename: info for info in self._zip.infolist() if not info.is_dir()}
+        elif tarfile.is_tarfile(path):
+            self._zip = None
+            self._tar = tarfile.open(path)
+            members = {member.name: member for member in self._tar.getmembers() if member.isfile()}
+        else:
+            raise ValueError('Images must be a zip or tar archive')
+        self._members = {name[2:] if name.startswith('./') else name: member
+                         for name, member in members.items()}
+
+    def size(self, name):
+        """Uncompressed size of a member, or None if the archive lacks it"""
+        member = self._members.get(name)
+        if member is None:
+            return None
+        return member.file_size if self._zip is not None else member.size
+
+    def copy_to(self, name, f):
+        member = self._members[name]
+        if self._zip is not None:
+            # ZipFile reads members safely from several threads
+            with self._zip.open(member) as source:
+                shutil.copyfileobj(source, f, 64 * 1024)
+        else:
+            # A tar is one stream, so members are read one at a time
+            with self._lock:
+                shutil.copyfileobj(self._tar.extractfile(member), f, 64 * 1024)
+
+    def close(self):
+        (self._zip or self._tar).close()
+
+def read_import_rows(path, filename='', data_format=None):
+    """Yield (row number, dict) from a CSV or NDJSON file
+
+    Rows that cannot be parsed are yielded as (row number, ValueError) so
+    the importer can report them and carry on.
+    """
+    if data_format is None:
+        ext = os.path.splitext(filename or path)[1].lower()
+        if ext == '.csv':
+            data_format = 'csv'
+        elif ext in ('.ndjson', '.jsonl', '.json'):
+            data_format = 'ndjson'
+        else:
+            with open(path, 'rb') as f:
+                data_format = 'ndjson' if f.read(64).lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'{') else 'csv'
+    if data_format not in ('csv', 'ndjson'):
+        raise ValueError('Data format must be csv or ndjson')
+
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if data_format == 'csv':
+            reader = csv.DictReader(f)
+            try:
+                for number, row in enumerate(reader, 1):
+                    yield number, row
+            except (csv.Error, UnicodeDecodeError) as e:
+                yield reader.line_num, ValueError(f'Unreadable CSV: {e}')
+            return
+
+        number = 0
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield number, ValueError('Invalid JSON')
+                    continue
+                yield number, row if isinstance(row, dict) else ValueError('Each line must be a JSON object')
+        except UnicodeDecodeError as e:
+            yield number + 1, ValueError(f'Unreadable NDJSON: {e}')
+
+class PetImporter:
+    """Bulk-loads pets for one donor from parsed rows and an optional photo archive
+
+    Rows are checked like donations. Each batch has its photos copied out of
+    the archive on a small thread pool and goes into the database with one
+    executemany in one transaction; variants are then queued on the image
+    pipeline. A row may name an http(s) image URL instead of a photo.
+    """
+    batch_size = 1000
+    max_reported_errors = 100
+
+    def __init__(self, donor_id, archive=None, upload_dir='uploads', workers=4,
+                 max_image_size=20 * 1024 * 1024):
+        self.donor_id = donor_id
+        self.archive = archive
+        self.upload_dir = upload_dir
+        self.workers = workers
+        self.max_image_size = max_image_size
+
+    def run(self, rows, progress=None):
+        """Import every row; progress(report) is called after each batch"""
+        start = time.perf_counter()
+        report = {'rows': 0, 'imported': 0, 'failed': 0, 'errors': []}
+        batch = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import-worker') as pool:
+            for number, row in rows:
+                report['rows'] += 1
+                try:
+                    if isinstance(row, Exception):
+                        raise row
+                    batch.append((number, self.validate(row)))
+                except ValueError as e:
+                    self._fail(report, number, str(e))
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch, pool, report)
+                    batch = []
+                    if progress:
+                        progress(report)
+            if batch:
+                self._import_batch(batch, pool, report)
+        report['seconds'] = round(time.perf_counter() - start, 3)
+        if progress:
+            progress(report)
+        return report
+
+    def validate(self, row):
+        """Clean one row into pet fields, raising ValueError with the reason"""
+        pet = {}
+        for name in ('name', 'age', 'breed', 'species', 'bio', 'image', 'location', 'price'):
+            value = row.get(name)
+            pet[name] = '' if value is None else str(value).strip()
+
+        missing = [name for name in ('name', 'age', 'breed', 'species', 'bio') if not pet[name]]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)}")
+        try:
+            pet['age'] = int(pet['age'])
+        except ValueError:
+            raise ValueError('Age must be a whole number')
+        pet['price'] = int(pet['price']) if re.fullmatch(r'[0-9]+', pet['price']) else 0
+        pet['location'] = pet['location'] or 'dhaka'
+
+        image = pet['image']
+        if not image:
+            raise ValueError('Image is required')
+        if not re.match(r'https?://', image):
+            if self.archive is None:
+                raise ValueError(f'Image {image} needs an images archive')
+            size = self.archive.size(image)
+            if size is None:
+                raise ValueError(f'Image {image} is not in the archive')
+            if size > self.max_image_size:
+                raise ValueError(f'Image {image} is too large')
+            if os.path.splitext(image)[1].lower() not in IMAGE_EXTENSIONS:
+                raise ValueError(f'Image {image} is not a supported image type')
+        return pet
+
+    def _fail(self, report, number, error):
+        report['failed'] += 1
+        if len(report['errors']) < self.max_reported_errors:
+            report['errors'].append({'row': number, 'error': error})
+
+    def _store_image(self, image):
+        """Copy a photo out of the archive into uploads; URLs are kept as they are"""
+        if re.match(r'https?://', image):
+            return image
+        filepath = os.path.join(self.upload_dir, f'{uuid.uuid4()}{os.path.splitext(image)[1].lower()}')
+        # Dot-prefixed temp names are never served
+        temp = tempfile.NamedTemporaryFile(dir=self.upload_dir, prefix='.import-', delete=False)
+        try:
+            with temp:
+                self.archive.copy_to(image, temp)
+            os.chmod(temp.name, 0o644)
+            os.replace(temp.name, filepath)
+        except BaseException:
+            os.unlink(temp.name)
+            raise
+        return filepath
+
+    def _import_batch(self, batch, pool, report):
+        futures = [(number, pet, pool.submit(self._store_image, pet['image'])) for number, pet in batch]
+        stored = []
+        for number, pet, future in futures:
+            try:
+                stored.append((number, pet, future.result()))
+            except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+                self._fail(report, number, f"Could not read image {pet['image']}: {e}")
+        if not stored:
+            return
+
+        now = datetime.now()
+        with db_pool.connection() as conn:
+            try:
+                conn.executemany('''
+                    INSERT INTO pets (name, age, breed, species, bio, image, donated_by, status, created_at, location, price)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, 'available', ?, ?, ?)
+                ''', [(pet['name'], pet['age'], pet['breed'], pet['species'], pet['bio'], image,
+                       self.donor_id, now, pet['location'], pet['price']) for _, pet, image in stored])
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                for number, pet, image in stored:
+                    if image != pet['image']:
+                        os.unlink(image)
+                    self._fail(report, number, f'Database error: {e}')
+                return
+
+        catalogue.bump()
+        report['imported'] += len(stored)
+        for _, pet, image in stored:
+            if image != pet['image']:
+                image_pipeline.submit(image)
+
+class MultipartError(Exception):
+    """Malformed or oversized multipart/form-data body"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class MultipartParser:
+    """Incremental multipart/form-data parser
+
+    Reads the request body in fixed-size chunks. File parts are streamed
+    straight into temporary files in upload_dir and regular fields are kept
+    in memory under size limits, so peak memory does not depend on the size
+    of the upload. Call cleanup() once any wanted files have been moved.
+    """
+    chunk_size = 64 * 1024
+    max_header_size = 16 * 1024
+    max_parts = 64
+
+    def __init__(self, rfile, boundary, content_length, upload_dir='uploads',
+                 max_field_size=64 * 1024, max_fields_size=1024 * 1024,
+                 max_file_size=20 * 1024 * 1024):
+        self.rfile = rfile
+        self.boundary = boundary.encode('latin-1')
+        self.upload_dir = upload_dir
+        self.max_field_size = max_field_size
+        self.max_fields_size = max_fields_size
+        self.max_file_size = max_file_size
+        self._remaining = content_length
+        self._buffer = bytearray()
+        self._temp_paths = []
+
+    @staticmethod
+    def boundary_from(content_type):
+        """Extract the boundary parameter from a Content-Type header"""
+        match = re.search(r'boundary=(?:"([^"]+)"|([^;\s]+))', content_type or '')
+        if not match:
+            raise MultipartError('Missing multipart boundary')
+        return match.group(1) or match.group(2)
+
+    def parse(self):
+        """Return (form_data, files); files map to {'filename', 'path', 'size'}"""
+        form_data = {}
+        files = {}
+        fields_size = 0
+        delimiter = b'--' + self.boundary
+        
+        try:
+            # Skip any preamble before the first boundary
+            self._read_until(delimiter, None)
             
-            if name:
-                if filename:
-                    # It's a file
-                    files[name] = {
-                        'filename': filename,
-                        'content': content
-                    }
+            for _ in range(self.max_parts):
+                self._require(2)
+                if self._buffer[:2] == b'--':
+                    break
+                if self._buffer[:2] != b'\r\n':
+                    raise MultipartError('Malformed multipart boundary')
+                del self._buffer[:2]
+                
+                name, filename = self._read_part_headers()
+                
+                if filename is not None:
+                    files[name] = self._read_file_part(filename, b'\r\n' + delimiter)
                 else:
-                    # It's a regular form field
-                    form_data[name] = content.decode('utf-8')
+                    value = bytearray()
+                    
+                    def collect(data):
+                        if len(value) + len(data) > self.max_field_size:
+                            raise MultipartError(f'Field {name!r} is too large', 413)
+                        value.extend(data)
+                    
+                    self._read_until(b'\r\n' + delimiter, collect)
+                    fields_size += len(value)
+                    if fields_size > self.max_fields_size:
+                        raise MultipartError('Form fields are too large', 413)
+                    if name is not None:
+                        form_data[name] = value.decode('utf-8')
+            else:
+                raise MultipartError('Too many form parts')
+        except Exception:
+            self.cleanup()
+            raise
         
         return form_data, files
 
-    def do_GET(self):
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-        query = parse_qs(parsed_path.query)
-        
-        if path == '/' or path == '/index.html':
-            self.serve_file('index.html')
-        elif path == '/login.html':
-            self.serve_file('login.html')
-        elif path == '/signup.html':
-            self.serve_file('signup.html')
-        elif path == '/dashboard.html':
-            if self.check_auth():
-                self.serve_file('dashboard.html')
+    def cleanup(self):
+        """Delete temporary files that were not moved away"""
+        for path in self._temp_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._temp_paths = []
+
+    def _fill(self):
+        if self._remaining <= 0:
+            return False
+        chunk = self.rfile.read(min(self.chunk_size, self._remaining))
+        if not chunk:
+            self._remaining = 0
+            return False
+        self._remaining -= len(chunk)
+        self._buffer += chunk
+        return True
+
+    def _require(self, size):
+        while len(self._buffer) < size:
+            if not self._fill():
+                raise MultipartError('Unexpected end of form data')
+
+    def _read_until(self, marker, write):
+        """Pass everything before marker to write (or drop it) and consume the marker"""
+        while True:
+            index = self._buffer.find(marker)
+            if index != -1:
+                if write and index:
+                    write(bytes(self._buffer[:index]))
+                del self._buffer[:index + len(marker)]
+                return
+            # Hold back a tail that could be the start of a marker split
+            # across two reads
+            flushable = len(self._buffer) - (len(marker) - 1)
+            if flushable > 0:
+                if write:
+                    write(bytes(self._buffer[:flushable]))
+                del self._buffer[:flushable]
+            if not self._fill():
+                raise MultipartError('Unexpected end of form data')
+
+    def _read_part_headers(self):
+        while True:
+            index = self._buffer.find(b'\r\n\r\n')
+            if index != -1:
+                break
+            if len(self._buffer) > self.max_header_size:
+                raise MultipartError('Part headers are too large', 413)
+            if not self._fill():
+                raise MultipartError('Unexpected end of form data')
+        
+        headers = self._buffer[:index].decode('utf-8', 'replace')
+        del self._buffer[:index + 4]
+        
+        # Parse Content-Disposition header
+        name = None
+        filename = None
+        for line in headers.split('\r\n'):
+            if line.lower().startswith('content-disposition:'):
+                params = dict(re.findall(r';\s*(\w+)="([^"]*)"', line))
+                name = params.get('name')
+                filename = params.get('filename')
+        return name, filename
+
+    def _read_file_part(self, filename, marker):
+        if not filename:
+            # Browsers send an empty part when no file was chosen
+            self._read_until(marker, None)
+            return {'filename': '', 'path': None, 'size': 0}
+        
+        os.makedirs(self.upload_dir, exist_ok=True)
+        temp = tempfile.NamedTemporaryFile(dir=self.upload_dir, prefix='.upload-', delete=False)
+        self._temp_paths.append(temp.name)
+        size = 0
+        
+        def write(data):
+            nonlocal size
+            size += len(data)
+            if size > self.max_file_size:
+                raise MultipartError(f'{filename} is too large', 413)
+            temp.write(data)
+        
+        with temp:
+            self._read_until(marker, write)
+        return {'filename': filename, 'path': temp.name, 'size': size}
+
+ADMIN_EMAIL = 'admin@petcenter.com'
+
+class Route:
+    """A handler method name plus the middleware and fixed arguments it runs with"""
+
+    def __init__(self, method, pattern, handler, middleware=(), kwargs=None):
+        self.method = method
+        self.pattern = pattern
+        self.handler = handler
+        self.middleware = tuple(middleware)
+        self.kwargs = kwargs or {}
+
+class Router:
+    """Dispatch table from (method, path) to PetAdoptionHandler methods
+
+    Plain paths resolve with one dict lookup. Patterns with <name> segments
+    live in a trie keyed by path segment, and a final <*name> segment takes
+    the rest of the path. Captured segments are passed to the handler as
+    keyword arguments.
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._trie = self._node()
+        self._fallbacks = {}
+        self.routes = []
+
+    @staticmethod
+    def _node():
+        return {'literal': {}, 'param': None, 'rest': None, 'routes': {}}
+
+    def add(self, method, pattern, handler, middleware=(), **kwargs):
+        route = Route(method, pattern, handler, middleware, kwargs)
+        self.routes.append(route)
+        if '<' not in pattern:
+            self._exact.setdefault(pattern, {})[method] = route
+            return route
+        
+        node = self._trie
+        for segment in pattern.split('/')[1:]:
+            if segment.startswith('<*'):
+                if node['rest'] is None:
+                    node['rest'] = (segment[2:-1], {})
+                node['rest'][1][method] = route
+                return route
+            if segment.startswith('<'):
+                if node['param'] is None:
+                    node['param'] = (segment[1:-1], self._node())
+                node = node['param'][1]
             else:
-                self.redirect('/login.html')
-        elif path == '/style.css':
-            self.serve_file('style.css', 'text/css')
-        elif path == '/script.js':
-            self.serve_file('script.js', 'application/javascript')
-        elif path == '/api/pets':
-            self.get_pets(query)
-        elif path == '/api/user':
-            self.get_user()
-        elif path == '/api/adoptions':
-            self.get_adoptions()
-        elif path == '/api/applications':
-            self.get_applications()
-        elif path == '/api/my-donations':
-            self.get_my_donations()
-        elif path.startswith('/uploads/'):
-            self.serve_upload(path)
-        else:
-            self.send_error(404)
+                node = node['literal'].setdefault(segment, self._node())
+        node['routes'][method] = route
+        return route
+
+    def fallback(self, method, handler, middleware=(), **kwargs):
+        """Route requests no pattern matches; the handler gets the path"""
+        route = Route(method, '*', handler, middleware, kwargs)
+        self.routes.append(route)
+        self._fallbacks[method] = route
 
-    def do_POST(self):
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-        
-        if path == '/api/signup':
-            self.handle_signup()
-        elif path == '/api/login':
-            self.handle_login()
-        elif path == '/api/logout':
-            self.handle_logout()
-        elif path == '/api/apply':
-            self.handle_apply()
-        elif path == '/api/approve-application':
-            self.handle_approve_application()
-        elif path == '/api/donate':
-            self.handle_donate()
-        elif path == '/api/remove-donation':
-            self.handle_remove_donation()
-        elif path == '/api/delete-pet':
-            self.handle_delete_pet()
+    def match(self, path):
+        """Return ({method: route}, params) for a path, or (None, {})"""
+        routes = self._exact.get(path)
+        if routes is not None:
+            return routes, {}
+        return self._match_node(self._trie, path.split('/')[1:], {})
+
+    def _match_node(self, node, segments, params):
+        if not segments:
+            return (node['routes'], params) if node['routes'] else (None, {})
+        segment, remaining = segments[0], segments[1:]
+        # Literal segments win over parameters, parameters over the rest
+        child = node['literal'].get(segment)
+        if child is not None:
+            routes, found = self._match_node(child, remaining, params)
+            if routes is not None:
+                return routes, found
+        if node['param'] is not None and segment:
+            name, child = node['param']
+            routes, found = self._match_node(child, remaining, {**params, name: segment})
+            if routes is not None:
+                return routes, found
+        if node['rest'] is not None:
+            name, routes = node['rest']
+            return routes, {**params, name: '/'.join(segments)}
+        return None, {}
+
+    def dispatch(self, handler, method):
+        """Run the request through its route and record it in metrics"""
+        start = time.perf_counter()
+        handler.status = None
+        handler.route = None
+        wfile = handler.wfile = CountingWriter(handler.wfile)
+        try:
+            self._dispatch(handler, method)
+        finally:
+            handler.wfile = wfile.wfile
+            elapsed = time.perf_counter() - start
+            label = handler.route.pattern if handler.route else 'unmatched'
+            try:
+                bytes_in = int(handler.headers.get('Content-Length', 0))
+            except ValueError:
+                bytes_in = 0
+            metrics.observe_request(method, label, handler.status or 0, elapsed, bytes_in, wfile.count)
+            if access_log is not None:
+                access_log.write(handler, label, elapsed, bytes_in, wfile.count)
+
+    def _dispatch(self, handler, method):
+        parsed = urlparse(handler.path)
+        handler.query = parse_qs(parsed.query)
+        routes, params = self.match(parsed.path)
+        if routes is None:
+            route = self._fallbacks.get(method)
+            if route is None:
+                handler.send_error(404)
+                return
+            params = {'path': parsed.path}
         else:
-            self.send_error(404)
+            route = routes.get(method)
+            if route is None:
+                # Any route of the path carries its pattern for the metrics
+                handler.route = next(iter(routes.values()))
+                handler.method_not_allowed(sorted(routes))
+                return
+        
+        handler.route = route
+        call = lambda: getattr(handler, route.handler)(**params, **route.kwargs)
+        for middleware in reversed(route.middleware):
+            call = functools.partial(middleware, handler, call)
+        call()
+
+    def missing_handlers(self, handler_class):
+        """Routes whose handler method does not exist on handler_class"""
+        return [route for route in self.routes
+                if not callable(getattr(handler_class, route.handler, None))]
+
+# Middleware take (handler, call_next) and either answer the request
+# themselves or call call_next() to continue down the chain
+
+def require_user(handler, call_next):
+    """Answer 401 without a live session; otherwise set handler.user"""
+    handler.user = handler.get_current_user()
+    if handler.user is None:
+        handler.send_json({'error': 'Not authenticated'}, 401)
+        return
+    call_next()
+
+def require_admin(handler, call_next):
+    handler.user = handler.get_current_user()
+    if handler.user is None or handler.user['email'] != ADMIN_EMAIL:
+        handler.send_json({'error': 'Unauthorized'}, 403)
+        return
+    call_next()
+
+def require_metrics_access(handler, call_next):
+    """Let scrapers in with the --metrics-token bearer token; anyone else must be the admin"""
+    if metrics.token:
+        expected = f'Bearer {metrics.token}'.encode('utf-8')
+        if secrets.compare_digest(handler.headers.get('Authorization', '').encode('utf-8'), expected):
+            call_next()
+            return
+    require_admin(handler, call_next)
+
+def require_login_page(handler, call_next):
+    """Send visitors without a session to the login page"""
+    if not handler.check_auth():
+        handler.redirect('/login.html')
+        return
+    call_next()
+
+def json_body(handler, call_next):
+    """Parse the JSON request body into handler.body; 400 when it is not a JSON object"""
+    try:
+        content_length = int(handler.headers.get('Content-Length', 0))
+        body = json.loads(handler.rfile.read(content_length).decode('utf-8')) if content_length else {}
+    except (ValueError, UnicodeDecodeError):
+        body = None
+    if not isinstance(body, dict):
+        handler.send_json({'error': 'Invalid JSON body'}, 400)
+        return
+    handler.body = body
+    call_next()
+
+router = Router()
 
-    def serve_file(self, filename, content_type='text/html'):
+# Pages and static files
+router.add('GET', '/', 'serve_asset', filename='index.html')
+router.add('GET', '/index.html', 'serve_asset', filename='index.html')
+router.add('GET', '/login.html', 'serve_asset', filename='login.html')
+router.add('GET', '/signup.html', 'serve_asset', filename='signup.html')
+router.add('GET', '/dashboard.html', 'serve_asset', [require_login_page],
+           filename='dashboard.html', cache_control='private, no-cache')
+router.add('GET', '/style.css', 'serve_asset', filename='style.css')
+router.add('GET', '/script.js', 'serve_asset', filename='script.js')
+router.add('GET', '/uploads/<*name>', 'serve_upload')
+router.add('GET', '/metrics', 'get_metrics', [require_metrics_access])
+router.fallback('GET', 'serve_fingerprinted_asset')
+
+# API
+router.add('GET', '/api/pets', 'get_pets')
+router.add('GET', '/api/pets/facets', 'get_pet_facets')
+router.add('GET', '/api/pets/<pet_id>', 'get_pet')
+router.add('GET', '/api/user', 'get_user', [require_user])
+router.add('GET', '/api/adoptions', 'get_adoptions', [require_user])
+router.add('GET', '/api/applications', 'get_applications', [require_user])
+router.add('GET', '/api/my-donations', 'get_my_donations', [require_user])
+router.add('GET', '/api/my-donations/pending', 'get_pending_applications', [require_user])
+router.add('POST', '/api/signup', 'handle_signup', [json_body])
+router.add('POST', '/api/login', 'handle_login', [json_body])
+router.add('POST', '/api/logout', 'handle_logout')
+router.add('POST', '/api/apply', 'handle_apply', [require_user, json_body])
+router.add('POST', '/api/approve-application', 'handle_approve_application', [require_user, json_body])
+router.add('POST', '/api/donate', 'handle_donate', [require_user])
+router.add('POST', '/api/import-pets', 'handle_import_pets', [require_user])
+router.add('POST', '/api/remove-donation', 'handle_remove_donation', [require_user, json_body])
+router.add('POST', '/api/delete-pet', 'handle_delete_pet', [require_admin, json_body])
+router.add('GET', '/api/admin/slow-queries', 'get_slow_queries', [require_admin])
+
+class PetAdoptionHandler(BaseHTTPRequestHandler):
+    # Persistent connections: every response carries its length, and a
+    # connection closes once it has served max_keepalive_requests. Idle
+    # connections are left to the server (see PooledHTTPServer). timeout
+    # bounds each read and write while a request is in progress.
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; with Nagle on, the body of a
+    # reused connection waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+    timeout = 60
+    max_keepalive_requests = 100
+    # Unread request bodies up to this size are skipped; larger ones close
+    max_discard_size = 64 * 1024
+    # JSON arrays of at least this many items are streamed in chunks of this size
+    stream_threshold = 256
+    stream_chunk_size = 64 * 1024
+
+    def __init__(self, request, client_address, server, requests_served=0):
+        self.sessions = {}
+        # Requests already served on this connection by earlier handlers
+        self.requests_served = requests_served
+        self.idle = False
+        super().__init__(request, client_address, server)
+
+    def handle(self):
+        """Serve requests until the connection closes, goes idle or reaches the limit
+
+        Pipelined requests are answered on the spot. A connection with
+        nothing more to read is left open with idle set, for a server that
+        can park it; other servers close it.
+        """
+        self.close_connection = True
+        while True:
+            self.requests_served += 1
+            self.body_reader = None
+            self.handle_one_request()
+            if self.close_connection or not self.discard_unread_body():
+                return
+            try:
+                if not self.request_pending():
+                    self.idle = hasattr(self.server, 'park')
+                    return
+            except ConnectionError:
+                return
+
+    def request_pending(self):
+        """Whether the next request is already buffered or readable, without waiting"""
+        self.connection.setblocking(False)
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                content = f.read()
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
+            return bool(self.rfile.peek(1))
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def discard_unread_body(self):
+        """Skip whatever the handler left of the request body; False to close instead"""
+        body = self.body_reader
+        if body is None or not body.remaining:
+            return True
+        if body.remaining > self.max_discard_size:
+            return False
+        try:
+            while body.remaining:
+                if not body.read(min(body.remaining, 16 * 1024)):
+                    return False
+        except (TimeoutError, ConnectionError):
+            return False
+        return True
+
+    def dispatch(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0 or 'Transfer-Encoding' in self.headers:
+            # Without a usable length the end of the body can't be found
+            length = 0
+            self.close_connection = True
+        rfile = self.rfile
+        self.rfile = self.body_reader = BodyReader(rfile, length)
+        try:
+            router.dispatch(self, self.command)
+        finally:
+            self.rfile = rfile
+
+    def send_response(self, code, message=None):
+        self.status = code
+        super().send_response(code, message)
+        if self.requests_served >= self.max_keepalive_requests:
+            self.send_header('Connection', 'close')
+
+    def log_request(self, code='-', size='-'):
+        # The structured access log replaces the default one when enabled
+        if access_log is None:
+            super().log_request(code, size)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = dispatch
+
+    def method_not_allowed(self, allowed):
+        body = json.dumps({'error': 'Method not allowed'}).encode('utf-8')
+        self.send_response(405)
+        self.send_header('Allow', ', '.join(allowed))
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_asset(self, filename, cache_control='no-cache', fingerprint=None):
+        """Serve a page or asset from the in-memory cache in the best encoding the client takes"""
+        asset = asset_cache.get(filename)
+        if asset is None:
+            self.send_error(404)
+            return
+        
+        # Fingerprinted URLs never change content; stale fingerprints from an
+        # old page still get the current file, just without long caching
+        if fingerprint is not None and fingerprint == asset.fingerprint:
+            cache_control = 'public, max-age=31536000, immutable'
+        
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding'), asset.variants)
+        body, etag = asset.variants[encoding]
+        
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and etag_matches(if_none_match, etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
             self.end_headers()
-            self.wfile.write(content.encode('utf-8'))
-        except FileNotFoundError:
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', f'{asset.content_type}; charset=utf-8')
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_slow_queries(self):
+        limit = int_param(self.query, 'limit', 20, maximum=500)
+        self.send_json({
+            'threshold_ms': slow_queries.threshold * 1000,
+            'queries': slow_queries.top(limit)
+        })
+
+    def get_metrics(self):
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_fingerprinted_asset(self, path):
+        resolved = asset_cache.resolve(path)
+        if resolved is None:
             self.send_error(404)
+            return
+        filename, fingerprint = resolved
+        self.serve_asset(filename, fingerprint=fingerprint)
 
-    def serve_upload(self, path):
+    def serve_upload(self, name):
+        variant = re.fullmatch(r'([0-9a-f-]{36})/(\w+)', name)
+        if variant:
+            self.serve_image_variant(*variant.groups())
+            return
+        
+        filename = unquote(name)
+        # Only plain file names; this also hides in-progress temp uploads
+        if not filename or filename.startswith('.') or '/' in filename or '\\' in filename:
+            self.send_error(404)
+            return
+        
+        content_type, _ = mimetypes.guess_type(filename)
+        # Upload names are random UUIDs that are never reused for new content
+        self.send_file(os.path.join('uploads', filename), content_type or 'application/octet-stream',
+                       'public, max-age=31536000, immutable')
+
+    def serve_image_variant(self, image_id, size):
+        if size not in IMAGE_VARIANTS:
+            self.send_error(404)
+            return
+        
+        # WebP for browsers that take it, JPEG for the rest
+        ext = 'webp' if 'image/webp' in self.headers.get('Accept', '') else 'jpg'
+        path = image_pipeline.ensure(image_id, size, ext)
+        if path is not None:
+            content_type = 'image/webp' if ext == 'webp' else 'image/jpeg'
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            # No Pillow or an unreadable original: fall back to the upload
+            # itself, cached briefly so a real variant can replace it later
+            path = image_pipeline.original_path(image_id)
+            if path is None:
+                self.send_error(404)
+                return
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            cache_control = 'public, max-age=86400'
+        
+        self.send_file(path, content_type, cache_control, vary='Accept')
+
+    def send_file(self, filepath, content_type, cache_control, vary=None):
+        """Send a file with validators, conditional GET and single byte ranges"""
         try:
-            filename = path[1:]  # Remove leading slash
-            with open(filename, 'rb') as f:
-                content = f.read()
-            content_type, _ = mimetypes.guess_type(filename)
-            self.send_response(200)
-            self.send_header('Content-type', content_type or 'application/octet-stream')
-            self.end_headers()
-            self.wfile.write(content)
-        except FileNotFoundError:
+            f = open(filepath, 'rb')
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError, PermissionError):
             self.send_error(404)
+            return
+        
+        with f:
+            file_stat = os.fstat(f.fileno())
+            if not stat.S_ISREG(file_stat.st_mode):
+                self.send_error(404)
+                return
+            size = file_stat.st_size
+            etag = f'"{size:x}-{file_stat.st_mtime_ns:x}"'
+            last_modified = email.utils.formatdate(file_stat.st_mtime, usegmt=True)
+            
+            if self.not_modified(etag, file_stat.st_mtime):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.send_header('Cache-Control', cache_control)
+                if vary:
+                    self.send_header('Vary', vary)
+                self.end_headers()
+                return
+            
+            status = 200
+            start, end = 0, size - 1
+            range_header = self.headers.get('Range')
+            if_range = self.headers.get('If-Range')
+            # A stale If-Range means the client's partial copy is outdated
+            if range_header and (not if_range or if_range.strip() in (etag, last_modified)):
+                try:
+                    byte_range = parse_byte_range(range_header, size)
+                except ValueError:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if byte_range:
+                    status = 206
+                    start, end = byte_range
+            
+            length = end - start + 1
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(length))
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.send_header('Cache-Control', cache_control)
+            if vary:
+                self.send_header('Vary', vary)
+            self.end_headers()
+            self.copy_file_to_client(f, start, length)
+
+    def not_modified(self, etag, mtime):
+        """Whether the request's validators show the client's copy is current"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            return etag_matches(if_none_match, etag)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return since.tzinfo is not None and int(mtime) <= since.timestamp()
+        return False
+
+    def copy_file_to_client(self, f, offset, count):
+        """Write count bytes of f from offset, with sendfile(2) when the socket allows it"""
+        sendfile = getattr(self.connection, 'sendfile', None)
+        if sendfile is not None:
+            self.wfile.flush()
+            sendfile(f, offset, count)
+            # The kernel's bytes bypass wfile, so count them here
+            self.wfile.count += count
+            return
+        
+        f.seek(offset)
+        while count > 0:
+            chunk = f.read(min(count, 64 * 1024))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            count -= len(chunk)
 
     def get_session_id(self):
-        cookies = self.headers.get('Cookie', '')
-        for cookie in cookies.split(';'):
-            if cookie.strip().startswith('session_id='):
-                return cookie.split('=')[1].strip()
-        return None
+        return session_id_from_cookie(self.headers.get('Cookie', ''))
 
     def check_auth(self):
-        session_id = self.get_session_id()
-        if not session_id:
-            return False
-        
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id FROM sessions WHERE session_id = ? AND expires_at > ?', 
-                      (session_id, datetime.now()))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
+        return self.get_current_user() is not None
 
     def get_current_user(self):
         session_id = self.get_session_id()
         if not session_id:
             return None
-        
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT u.id, u.name, u.email FROM users u
-            JOIN sessions s ON u.id = s.user_id
-            WHERE s.session_id = ? AND s.expires_at > ?
-        ''', (session_id, datetime.now()))
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return {'id': result[0], 'name': result[1], 'email': result[2]}
-        return None
+        return session_user(session_id)
+
+    def send_json(self, data, status=200, revalidate=False):
+        self.send_json_body(dump_json(data), status, revalidate)
 
-    def send_json(self, data, status=200):
+    def send_json_body(self, body, status=200, revalidate=False):
+        """Send already-serialized JSON (bytes or a CompressedBody), compressed if the client takes it"""
+        if not isinstance(body, CompressedBody):
+            body = CompressedBody(body)
+        encodings = body.encodings
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding'), encodings)
+        
+        # With revalidate the client may keep a copy and check it with If-None-Match
+        etag = None
+        if revalidate:
+            etag = body.etag if encoding == 'identity' else body.etag[:-1] + f'-{encoding}"'
+            if_none_match = self.headers.get('If-None-Match')
+            if if_none_match and etag_matches(if_none_match, etag):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')
+                if encodings:
+                    self.send_header('Vary', 'Accept-Encoding')
+                self.end_headers()
+                return
+        
+        content = body.encode(encoding)
         self.send_response(status)
         self.send_header('Content-type', 'application/json')
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(content)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        if encodings:
+            self.send_header('Vary', 'Accept-Encoding')
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+        self.wfile.write(content)
+
+    def send_json_array(self, items):
+        """Send an iterable of encoded JSON values as one array
+
+        Short results go out whole through send_json_body. From
+        stream_threshold items on, the rest are pulled from items as they
+        are written, so a large result never sits in memory at once.
+        """
+        head = list(itertools.islice(items, self.stream_threshold))
+        if len(head) < self.stream_threshold:
+            self.send_json_body(('[' + ', '.join(head) + ']').encode('utf-8'))
+            return
+        self.send_json_stream(itertools.chain(['[', ', '.join(head)], (', ' + item for item in items), [']']))
+
+    def send_json_stream(self, parts):
+        """Send JSON text produced piece by piece, chunked and compressed on the fly"""
+        encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        compressor = StreamCompressor(negotiate_encoding(self.headers.get('Accept-Encoding'), encodings))
+        # HTTP/1.0 clients get the body delimited by closing the connection
+        chunked = self.protocol_version == 'HTTP/1.1' and self.request_version == 'HTTP/1.1'
+
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        if compressor.encoding != 'identity':
+            self.send_header('Content-Encoding', compressor.encoding)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Vary', 'Accept-Encoding')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+
+        def write(data, last=False):
+            if chunked:
+                # The last chunk goes out with the terminator in one write, so
+                # Nagle's algorithm doesn't hold it back waiting for an ACK
+                data = (b'%x\r\n%b\r\n' % (len(data), data) if data else b'') + (b'0\r\n\r\n' if last else b'')
+            if data:
+                self.wfile.write(data)
+
+        buffer = []
+        size = 0
+        for part in parts:
+            buffer.append(part)
+            size += len(part)
+            if size >= self.stream_chunk_size:
+                write(compressor.compress(''.join(buffer).encode('utf-8')))
+                buffer = []
+                size = 0
+        write(compressor.compress(''.join(buffer).encode('utf-8')) + compressor.flush(), last=True)
 
     def redirect(self, location):
         self.send_response(302)
         self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
-    def get_pets(self, query):
-        page = int(query.get('page', [1])[0])
-        per_page = 6
-        offset = (page - 1) * per_page
-        
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
-        
-        # Build WHERE clause based on filters
-        where_conditions = ['status = "available"']
-        params = []
+    def get_pets(self):
+        query = self.query
+        # Hits skip SQLite and serialization; the generation itself touches
+        # the database at most once per CatalogueGeneration.refresh_interval
+        cache_key = (catalogue.current(), listing_cache_key(query))
+        body = pet_listing_cache.get(cache_key)
+        if body is not None:
+            self.send_json_body(body)
+            return
         
-        # Category filter
-        if 'category' in query and query['category'][0] != 'all':
-            where_conditions.append('species = ?')
-            params.append(query['category'][0])
+        per_page = 6
         
-        # Search filter
-        if 'search' in query and query['search'][0]:
-            search_term = f"%{query['search'][0]}%"
-            where_conditions.append('(name LIKE ? OR breed LIKE ? OR bio LIKE ?)')
-            params.extend([search_term, search_term, search_term])
+        where_clause, params = build_pet_filters(query)
+        sort_option = pet_sort_option(query)
+        
+        # A cursor resumes right after the last row of the previous page, so
+        # deep pages cost the same as the first; page numbers still use OFFSET
+        cursor_token = query.get('cursor', [''])[0]
+        if cursor_token:
+            try:
+                after = decode_pet_cursor(cursor_token, sort_option)
+            except ValueError as e:
+                self.send_json({'error': str(e)}, 400)
+                return
+            page = None
+            offset = 0
+        else:
+            after = None
+            page = int_param(query, 'page', 1)
+            offset = (page - 1) * per_page
+        
+        # count=exact always counts and count=none skips it; by default a
+        # total is counted once per filter signature and catalogue generation
+        count_mode = query.get('count', ['none' if cursor_token else 'cached'])[0]
+        count_key = (cache_key[0], where_clause, tuple(params))
+        total = None
         
-        # Location filter
-        if 'location' in query and query['location'][0]:
-            where_conditions.append('location = ?')
-            params.append(query['location'][0])
-        
-        # Price filters
-        if 'minPrice' in query and query['minPrice'][0]:
-            where_conditions.append('price >= ?')
-            params.append(int(query['minPrice'][0]))
-        
-        if 'maxPrice' in query and query['maxPrice'][0]:
-            where_conditions.append('price <= ?')
-            params.append(int(query['maxPrice'][0]))
-        
-        # Age filters
-        if 'ages[]' in query:
-            age_conditions = []
-            for age_range in query['ages[]']:
-                if age_range == '0-1':
-                    age_conditions.append('age BETWEEN 0 AND 1')
-                elif age_range == '1-3':
-                    age_conditions.append('age BETWEEN 1 AND 3')
-                elif age_range == '3-5':
-                    age_conditions.append('age BETWEEN 3 AND 5')
-                elif age_range == '5+':
-                    age_conditions.append('age >= 5')
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
             
-            if age_conditions:
-                where_conditions.append(f"({' OR '.join(age_conditions)})")
-        
-        # Location filters (from checkboxes)
-        if 'locations[]' in query:
-            location_conditions = []
-            for location in query['locations[]']:
-                location_conditions.append('location = ?')
-                params.append(location)
+            # Get total count
+            if count_mode == 'cached':
+                total = pet_count_cache.get(count_key)
+            if total is None and count_mode in ('cached', 'exact'):
+                cursor.execute(*pet_count_query(query))
+                total = cursor.fetchone()[0]
+                pet_count_cache.set(count_key, total)
             
-            if location_conditions:
-                where_conditions.append(f"({' OR '.join(location_conditions)})")
-        
-        where_clause = ' AND '.join(where_conditions)
-        
-        # Sort options
-        sort_clause = 'ORDER BY created_at DESC'  # default
-        if 'sort' in query:
-            sort_option = query['sort'][0]
-            if sort_option == 'oldest':
-                sort_clause = 'ORDER BY created_at ASC'
-            elif sort_option == 'price-low':
-                sort_clause = 'ORDER BY price ASC'
-            elif sort_option == 'price-high':
-                sort_clause = 'ORDER BY price DESC'
-        
-        # Get total count
-        cursor.execute(f'SELECT COUNT(*) FROM pets WHERE {where_clause}', params)
-        total = cursor.fetchone()[0]
-        
-        # Get pets for current page
-        cursor.execute(f'''
-            SELECT id, name, breed, age, species, image, bio, status, donated_by, location, price, created_at
-            FROM pets WHERE {where_clause}
-            {sort_clause}
-            LIMIT ? OFFSET ?
-        ''', params + [per_page, offset])
+            # Get pets for current page, plus one row to tell if there is another
+            cursor.execute(*build_pet_page_query(query, sort_option, per_page + 1, offset, after))
+            rows = cursor.fetchall()
+        
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_pet_cursor(sort_option, last[12], last[0])
+        
+        response = {
+            'per_page': per_page,
+            'has_more': has_more,
+            'next_cursor': next_cursor
+        }
+        if page is not None:
+            response['page'] = page
+        if total is not None:
+            response['total'] = total
+            response['total_pages'] = (total + per_page - 1) // per_page
+        
+        # Rows are encoded by template and spliced in ahead of the other fields
+        pets = '{"pets": [' + ', '.join(map(encode_pet_row, rows)) + '], '
+        body = CompressedBody((pets + json.dumps(response)[1:]).encode('utf-8'))
+        pet_listing_cache.set(cache_key, body)
+        self.send_json_body(body)
+
+    def get_pet_facets(self):
+        query = self.query
+        # Cached next to the listings and invalidated by the same generation
+        cache_key = (catalogue.current(), 'facets',
+                     listing_cache_key(query, PET_FACET_PARAMS + ('search', 'minPrice', 'maxPrice')))
+        body = pet_listing_cache.get(cache_key)
+        if body is None:
+            with db_pool.connection() as conn:
+                body = CompressedBody(dump_json(pet_facet_counts(conn, query)))
+            pet_listing_cache.set(cache_key, body)
+        self.send_json_body(body)
+
+    def get_pet(self, pet_id):
+        query = self.query
+        if not re.fullmatch(r'[0-9]+', pet_id):
+            self.send_error(404)
+            return
         
-        pets = []
-        for row in cursor.fetchall():
-            pets.append({
-                'id': row[0],
-                'name': row[1],
-                'breed': row[2],
-                'age': row[3],
-                'species': row[4],
-                'image': row[5],
-                'bio': row[6],
-                'status': row[7],
-                'donated_by': row[8],
-                'location': row[9],
-                'price': row[10],
-                'created_at': row[11]
-            })
+        # include=donor,applications embeds the donor's name and the application count
+        include = set(query.get('include', [''])[0].split(','))
+        columns = ', '.join(f'p.{column.strip()}' for column in PET_COLUMNS.split(','))
+        if 'donor' in include:
+            columns += ', u.name'
+        if 'applications' in include:
+            columns += ', p.application_count'
         
-        conn.close()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {columns}
+                FROM pets p
+                LEFT JOIN users u ON u.id = p.donated_by
+                WHERE p.id = ?
+            ''', (int(pet_id),))
+            row = cursor.fetchone()
+        
+        if not row:
+            self.send_json({'error': 'Pet not found'}, 404)
+            return
         
-        self.send_json({
-            'pets': pets,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
-        })
+        pet = pet_from_row(row)
+        extra = list(row[12:])
+        if 'donor' in include:
+            pet['donor'] = {'id': pet['donated_by'], 'name': extra.pop(0)}
+        if 'applications' in include:
+            pet['application_count'] = extra.pop(0)
+        
+        self.send_json(pet, revalidate=True)
 
     def get_user(self):
-        user = self.get_current_user()
-        if user:
-            self.send_json(user)
-        else:
-            self.send_json({'error': 'Not authenticated'}, 401)
+        self.send_json(self.user)
 
     def get_adoptions(self):
-        user = self.get_current_user()
-        if not user:
-            self.send_json({'error': 'Not authenticated'}, 401)
-            return
-        
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT a.id, p.name, p.breed, p.species, p.image, a.adopted_at
-            FROM adoptions a
-            JOIN pets p ON a.pet_id = p.id
-            WHERE a.adopter_id = ?
-            ORDER BY a.adopted_at DESC
-        ''', (user['id'],))
-        
-        adoptions = []
-        for row in cursor.fetchall():
-            adoptions.append({
-                'id': row[0],
-                'name': row[1],
-                'breed': row[2],
-                'species': row[3],
-                'image': row[4],
-                'adopted_at': row[5]
-            })
+        user = self.user
         
-        conn.close()
-        self.send_json(adoptions)
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT a.id, p.name, p.breed, p.species, p.image, a.adopted_at
+                FROM adoptions a
+                JOIN pets p ON a.pet_id = p.id
+                WHERE a.adopter_id = ?
+                ORDER BY a.adopted_at DESC
+            ''', (user['id'],))
+            # Keys come from the column names
+            self.send_json_array(map(cursor_template(cursor).encode, cursor))
 
     def get_applications(self):
-        user = self.get_current_user()
-        if not user:
-            self.send_json({'error': 'Not authenticated'}, 401)
-            return
-        
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT aa.id, p.name as pet_name, p.image, aa.applicant_name, 
-                   aa.applicant_email, aa.applicant_phone, aa.experience, 
-                   aa.living_situation, aa.reason, aa.status, aa.applied_at
-            FROM adoption_applications aa
-            JOIN pets p ON aa.pet_id = p.id
-            WHERE aa.applicant_id = ?
-            ORDER BY aa.applied_at DESC
-        ''', (user['id'],))
-        
-        applications = []
-        for row in cursor.fetchall():
-            applications.append({
-                'id': row[0],
-                'pet_name': row[1],
-                'pet_image': row[2],
-                'applicant_name': row[3],
-                'applicant_email': row[4],
-                'applicant_phone': row[5],
-                'experience': row[6],
-                'living_situation': row[7],
-                'reason': row[8],
-                'status': row[9],
-                'applied_at': row[10]
-            })
+        user = self.user
         
-        conn.close()
-        self.send_json(applications)
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT aa.id, p.name AS pet_name, p.image AS pet_image, aa.applicant_name, 
+                       aa.applicant_email, aa.applicant_phone, aa.experience, 
+                       aa.living_situation, aa.reason, aa.status, aa.applied_at
+                FROM adoption_applications aa
+                JOIN pets p ON aa.pet_id = p.id
+                WHERE aa.applicant_id = ?
+                ORDER BY aa.applied_at DESC
+            ''', (user['id'],))
+            # Keys come from the column names
+            self.send_json_array(map(cursor_template(cursor).encode, cursor))
 
     def get_my_donations(self):
-        user = self.get_current_user()
-        if not user:
-            self.send_json({'error': 'Not authenticated'}, 401)
-            return
-        
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
-        
-        # Get donated pets with application counts
-        cursor.execute('''
-            SELECT p.id, p.name, p.image, p.status, p.created_at,
-                   COUNT(aa.id) as application_count
-            FROM pets p
-            LEFT JOIN adoption_applications aa ON p.id = aa.pet_id
-            WHERE p.donated_by = ?
-            GROUP BY p.id
-            ORDER BY p.created_at DESC
-        ''', (user['id'],))
-        
-        donations = []
-        for row in cursor.fetchall():
-            pet_id = row[0]
+        query = self.query
+        user = self.user
+        
+        # include_applications=0 returns only the counts
+        include_applications = query.get('include_applications', ['1'])[0] not in ('0', 'false')
+        
+        # Donations are unpaginated unless per_page is given
+        per_page = int_param(query, 'per_page', 0, minimum=0, maximum=100)
+        page = int_param(query, 'page', 1)
+        limit_clause = ''
+        donation_params = [user['id']]
+        if per_page:
+            limit_clause = 'LIMIT ? OFFSET ?'
+            donation_params += [per_page, (page - 1) * per_page]
+        
+        with db_pool.connection() as conn:
+            # Both queries read one snapshot so their pets line up
+            conn.execute('BEGIN')
+            donations = conn.cursor()
             
-            # Get applications for this pet
-            cursor.execute('''
-                SELECT aa.id, aa.applicant_name, aa.applicant_email, 
+            # Get donated pets with application counts
+            donations.execute(f'''
+                SELECT p.id, p.name, p.image, p.status, p.created_at, p.application_count
+                FROM pets p
+                WHERE p.donated_by = ?
+                ORDER BY p.created_at DESC, p.id DESC
+                {limit_clause}
+            ''', donation_params)
+            if not include_applications:
+                self.send_json_array(map(cursor_template(donations).encode, donations))
+                return
+            donation_template = cursor_template(donations, raw_names=('applications',))
+            
+            # Get the applications for those pets in one query, in the same pet
+            # order, and merge them in while streaming
+            if per_page:
+                donations = donations.fetchall()
+                pet_ids = [row[0] for row in donations]
+                pet_filter = f"aa.pet_id IN ({', '.join('?' * len(pet_ids))})"
+                application_params = pet_ids
+            else:
+                pet_filter = 'p.donated_by = ?'
+                application_params = [user['id']]
+            
+            applications = conn.cursor()
+            applications.execute(f'''
+                SELECT aa.pet_id, aa.id, aa.applicant_name, aa.applicant_email, 
                        aa.applicant_phone, aa.experience, aa.living_situation, 
                        aa.reason, aa.status, aa.applied_at
                 FROM adoption_applications aa
-                WHERE aa.pet_id = ?
-                ORDER BY aa.applied_at DESC
-            ''', (pet_id,))
+                JOIN pets p ON aa.pet_id = p.id
+                WHERE {pet_filter}
+                ORDER BY p.created_at DESC, p.id DESC, aa.applied_at DESC
+            ''', application_params)
+            application_template = cursor_template(applications, start=1)
             
-            applications = []
-            for app_row in cursor.fetchall():
-                applications.append({
-                    'id': app_row[0],
-                    'applicant_name': app_row[1],
-                    'applicant_email': app_row[2],
-                    'applicant_phone': app_row[3],
-                    'experience': app_row[4],
-                    'living_situation': app_row[5],
-                    'reason': app_row[6],
-                    'status': app_row[7],
-                    'applied_at': app_row[8]
-                })
+            def donations_with_applications():
+                pending = next(applications, None)
+                for row in donations:
+                    encoded = []
+                    while pending is not None and pending[0] == row[0]:
+                        encoded.append(application_template.encode(pending[1:]))
+                        pending = next(applications, None)
+                    yield donation_template.encode(row, '[' + ', '.join(encoded) + ']')
             
-            donations.append({
-                'id': row[0],
-                'name': row[1],
-                'image': row[2],
-                'status': row[3],
-                'created_at': row[4],
-                'application_count': row[5],
-                'applications': applications
-            })
-        
-        conn.close()
-        self.send_json(donations)
+            self.send_json_array(donations_with_applications())
+
+    def get_pending_applications(self):
+        # Read from the trigger-maintained donor_stats row; only the
+        # dashboard asks, so /api/user stays served from the session cache
+        with db_pool.connection() as conn:
+            row = conn.execute('SELECT pending_applications FROM donor_stats WHERE donor_id = ?',
+                               (self.user['id'],)).fetchone()
+        self.send_json({'pending_applications': row[0] if row else 0})
 
     def handle_signup(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        data = json.loads(post_data.decode('utf-8'))
+        data = self.body
         
         name = data.get('name', '').strip()
         email = data.get('email', '').strip()
@@ -465,25 +3032,21 @@ class PetAdoptionHandler(BaseHTTPRequestHandler):
         # Hash password
         password_hash = hashlib.sha256(password.encode()).hexdigest()
         
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            cursor.execute('''
-                INSERT INTO users (name, email, password_hash, phone)
-                VALUES (?, ?, ?, ?)
-            ''', (name, email, password_hash, phone))
-            conn.commit()
-            self.send_json({'message': 'Account created successfully'})
-        except sqlite3.IntegrityError:
-            self.send_json({'error': 'Email already exists'}, 400)
-        finally:
-            conn.close()
+            try:
+                cursor.execute('''
+                    INSERT INTO users (name, email, password_hash, phone)
+                    VALUES (?, ?, ?, ?)
+                ''', (name, email, password_hash, phone))
+                conn.commit()
+                self.send_json({'message': 'Account created successfully'})
+            except sqlite3.IntegrityError:
+                self.send_json({'error': 'Email already exists'}, 400)
 
     def handle_login(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        data = json.loads(post_data.decode('utf-8'))
+        data = self.body
         
         email = data.get('email', '').strip()
         password = data.get('password', '')
@@ -494,57 +3057,57 @@ class PetAdoptionHandler(BaseHTTPRequestHandler):
         
         password_hash = hashlib.sha256(password.encode()).hexdigest()
         
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name FROM users WHERE email = ? AND password_hash = ?', 
-                      (email, password_hash))
-        user = cursor.fetchone()
-        
-        if user:
-            # Create session
-            session_id = secrets.token_urlsafe(32)
-            expires_at = datetime.now() + timedelta(days=7)
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, name FROM users WHERE email = ? AND password_hash = ?', 
+                          (email, password_hash))
+            user = cursor.fetchone()
+        
+            if user:
+                # Create session
+                session_id = secrets.token_urlsafe(32)
+                expires_at = int(time.time()) + SESSION_TTL
             
-            cursor.execute('''
-                INSERT INTO sessions (session_id, user_id, expires_at)
-                VALUES (?, ?, ?)
-            ''', (session_id, user[0], expires_at))
-            conn.commit()
+                cursor.execute('''
+                    INSERT INTO sessions (session_id, user_id, expires_at)
+                    VALUES (?, ?, ?)
+                ''', (session_id, user[0], expires_at))
+                conn.commit()
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Set-Cookie', f'session_id={session_id}; Path=/; Max-Age=604800')
-            self.end_headers()
-            self.wfile.write(json.dumps({'message': 'Login successful', 'user': {'id': user[0], 'name': user[1]}}).encode('utf-8'))
-        else:
-            self.send_json({'error': 'Invalid email or password'}, 401)
-        
-        conn.close()
+                body = json.dumps({'message': 'Login successful', 'user': {'id': user[0], 'name': user[1]}}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Set-Cookie', f'session_id={session_id}; Path=/; Max-Age={SESSION_TTL}')
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_json({'error': 'Invalid email or password'}, 401)
 
     def handle_logout(self):
         session_id = self.get_session_id()
         if session_id:
-            conn = sqlite3.connect('pets.db')
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
-            conn.commit()
-            conn.close()
-        
+            session_cache.pop(session_id)
+            with db_pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+                conn.commit()
+            # Unknown ids end nothing, so they don't touch the other workers
+            if cursor.rowcount > 0:
+                session_revocations.revoke(session_id)
+        
+        body = json.dumps({'message': 'Logged out successfully'}).encode('utf-8')
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Set-Cookie', 'session_id=; Path=/; Max-Age=0')
         self.end_headers()
-        self.wfile.write(json.dumps({'message': 'Logged out successfully'}).encode('utf-8'))
+        self.wfile.write(body)
 
     def handle_apply(self):
-        user = self.get_current_user()
-        if not user:
-            self.send_json({'error': 'Not authenticated'}, 401)
-            return
+        user = self.user
         
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        data = json.loads(post_data.decode('utf-8'))
+        data = self.body
         
         pet_id = data.get('pet_id')
         experience = data.get('experience', '').strip()
@@ -555,125 +3118,121 @@ class PetAdoptionHandler(BaseHTTPRequestHandler):
             self.send_json({'error': 'All fields are required'}, 400)
             return
         
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
-        
-        # Check if pet is available and get donor info
-        cursor.execute('SELECT id, donated_by FROM pets WHERE id = ? AND status = "available"', (pet_id,))
-        pet = cursor.fetchone()
-        
-        if not pet:
-            self.send_json({'error': 'Pet not available'}, 400)
-            conn.close()
-            return
-        
-        # Check if user already applied for this pet
-        cursor.execute('SELECT id FROM adoption_applications WHERE pet_id = ? AND applicant_id = ?', 
-                      (pet_id, user['id']))
-        existing_application = cursor.fetchone()
-        
-        if existing_application:
-            self.send_json({'error': 'You have already applied for this pet'}, 400)
-            conn.close()
-            return
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            # Create adoption application
-            cursor.execute('''
-                INSERT INTO adoption_applications 
-                (pet_id, applicant_id, donor_id, applicant_name, applicant_email, 
-                 applicant_phone, experience, living_situation, reason, applied_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (pet_id, user['id'], pet[1], user['name'], user['email'], 
-                  user.get('phone', ''), experience, living_situation, reason, datetime.now()))
+            # Check if pet is available and get donor info
+            cursor.execute('SELECT id, donated_by FROM pets WHERE id = ? AND status = "available"', (pet_id,))
+            pet = cursor.fetchone()
+        
+            if not pet:
+                self.send_json({'error': 'Pet not available'}, 400)
+                return
+        
+            # Check if user already applied for this pet
+            cursor.execute('SELECT id FROM adoption_applications WHERE pet_id = ? AND applicant_id = ?', 
+                          (pet_id, user['id']))
+            existing_application = cursor.fetchone()
+        
+            if existing_application:
+                self.send_json({'error': 'You have already applied for this pet'}, 400)
+                return
+        
+            try:
+                # Create adoption application
+                cursor.execute('''
+                    INSERT INTO adoption_applications 
+                    (pet_id, applicant_id, donor_id, applicant_name, applicant_email, 
+                     applicant_phone, experience, living_situation, reason, applied_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (pet_id, user['id'], pet[1], user['name'], user['email'], 
+                      user.get('phone', ''), experience, living_situation, reason, datetime.now()))
             
-            conn.commit()
-            self.send_json({'message': 'Application submitted successfully! The donor will review and contact you.'})
-        except Exception as e:
-            conn.rollback()
-            self.send_json({'error': 'Failed to submit application'}, 500)
-        finally:
-            conn.close()
+                conn.commit()
+                self.send_json({'message': 'Application submitted successfully! The donor will review and contact you.'})
+            except Exception as e:
+                conn.rollback()
+                self.send_json({'error': 'Failed to submit application'}, 500)
 
     def handle_approve_application(self):
-        user = self.get_current_user()
-        if not user:
-            self.send_json({'error': 'Not authenticated'}, 401)
-            return
+        user = self.user
         
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        data = json.loads(post_data.decode('utf-8'))
+        data = self.body
         
         application_id = data.get('application_id')
         
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
         
-        # Get application details and verify donor ownership
-        cursor.execute('''
-            SELECT aa.pet_id, aa.applicant_id, aa.donor_id, p.donated_by
-            FROM adoption_applications aa
-            JOIN pets p ON aa.pet_id = p.id
-            WHERE aa.id = ? AND aa.donor_id = ?
-        ''', (application_id, user['id']))
+            # Get application details and verify donor ownership
+            cursor.execute('''
+                SELECT aa.pet_id, aa.applicant_id, aa.donor_id, p.donated_by
+                FROM adoption_applications aa
+                JOIN pets p ON aa.pet_id = p.id
+                WHERE aa.id = ? AND aa.donor_id = ?
+            ''', (application_id, user['id']))
         
-        application = cursor.fetchone()
+            application = cursor.fetchone()
         
-        if not application:
-            self.send_json({'error': 'Application not found or unauthorized'}, 400)
-            conn.close()
-            return
+            if not application:
+                self.send_json({'error': 'Application not found or unauthorized'}, 400)
+                return
         
-        pet_id, applicant_id, donor_id, donated_by = application
+            pet_id, applicant_id, donor_id, donated_by = application
         
-        try:
-            # Update pet status to adopted
-            cursor.execute('UPDATE pets SET status = "adopted" WHERE id = ?', (pet_id,))
+            try:
+                # Update pet status to adopted
+                cursor.execute('UPDATE pets SET status = "adopted" WHERE id = ?', (pet_id,))
             
-            # Create adoption record
-            cursor.execute('''
-                INSERT INTO adoptions (pet_id, adopter_id, donor_id, adopted_at)
-                VALUES (?, ?, ?, ?)
-            ''', (pet_id, applicant_id, donor_id, datetime.now()))
+                # Create adoption record
+                cursor.execute('''
+                    INSERT INTO adoptions (pet_id, adopter_id, donor_id, adopted_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (pet_id, applicant_id, donor_id, datetime.now()))
             
-            # Update application status to approved
-            cursor.execute('UPDATE adoption_applications SET status = "approved" WHERE id = ?', 
-                          (application_id,))
+                # Update application status to approved
+                cursor.execute('UPDATE adoption_applications SET status = "approved" WHERE id = ?', 
+                              (application_id,))
             
-            # Reject all other applications for this pet
-            cursor.execute('UPDATE adoption_applications SET status = "rejected" WHERE pet_id = ? AND id != ?', 
-                          (pet_id, application_id))
+                # Reject all other applications for this pet
+                cursor.execute('UPDATE adoption_applications SET status = "rejected" WHERE pet_id = ? AND id != ?', 
+                              (pet_id, application_id))
             
-            conn.commit()
-            self.send_json({'message': 'Application approved! Pet has been adopted.'})
-        except Exception as e:
-            conn.rollback()
-            self.send_json({'error': 'Failed to approve application'}, 500)
-        finally:
-            conn.close()
+                conn.commit()
+                catalogue.bump()
+                self.send_json({'message': 'Application approved! Pet has been adopted.'})
+            except Exception as e:
+                conn.rollback()
+                self.send_json({'error': 'Failed to approve application'}, 500)
 
     def handle_donate(self):
-        user = self.get_current_user()
-        if not user:
-            self.send_json({'error': 'Not authenticated'}, 401)
-            return
+        user = self.user
         
         # Parse multipart form data
-        content_type = self.headers['Content-Type']
+        content_type = self.headers.get('Content-Type', '')
         if not content_type.startswith('multipart/form-data'):
             self.send_json({'error': 'Invalid content type'}, 400)
             return
         
-        # Extract boundary from content type
-        boundary = content_type.split('boundary=')[1]
-        
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        
-        # Parse multipart data
-        form_data, files = self.parse_multipart(post_data, boundary)
+        # Stream the body; the image goes straight to a temp file in uploads/
+        try:
+            boundary = MultipartParser.boundary_from(content_type)
+            content_length = int(self.headers.get('Content-Length', 0))
+            parser = MultipartParser(self.rfile, boundary, content_length, upload_dir='uploads')
+            form_data, files = parser.parse()
+        except MultipartError as e:
+            self.send_json({'error': str(e)}, e.status)
+            return
+        except (ValueError, UnicodeDecodeError):
+            self.send_json({'error': 'Invalid form data'}, 400)
+            return
         
+        try:
+            self.save_donation(user, form_data, files)
+        finally:
+            parser.cleanup()
+
+    def save_donation(self, user, form_data, files):
         name = form_data.get('name', '').strip()
         age = form_data.get('age', '').strip()
         breed = form_data.get('breed', '').strip()
@@ -693,110 +3252,175 @@ class PetAdoptionHandler(BaseHTTPRequestHandler):
         
         image_file = files['image']
         
-        # Create uploads directory if it doesn't exist
-        os.makedirs('uploads', exist_ok=True)
+        # Validate before the upload is moved where it would be served
+        try:
+            age_value = int(age)
+        except ValueError:
+            self.send_json({'error': 'Age must be a whole number'}, 400)
+            return
+        price_value = int(price) if re.fullmatch(r'[0-9]+', price) else 0
         
         # Generate unique filename
         file_ext = os.path.splitext(image_file['filename'])[1]
         filename = f"{uuid.uuid4()}{file_ext}"
         filepath = os.path.join('uploads', filename)
         
-        # Save uploaded file
-        with open(filepath, 'wb') as f:
-            f.write(image_file['content'])
+        # Move the streamed upload into place; temp files are created 0600
+        os.replace(image_file['path'], filepath)
+        os.chmod(filepath, 0o644)
         
         # Save to database
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
         
+            try:
+                cursor.execute('''
+                    INSERT INTO pets (name, age, breed, species, bio, image, donated_by, status, created_at, location, price)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (name, age_value, breed, species, bio, filepath, user['id'], 'available', datetime.now(), location, price_value))
+                conn.commit()
+            except Exception as e:
+                print(f"Error donating pet: {e}")
+                conn.rollback()
+                os.unlink(filepath)
+                self.send_json({'error': 'Failed to donate pet'}, 500)
+                return
+        
+        catalogue.bump()
+        image_pipeline.submit(filepath)
+        self.send_json({'message': 'Pet donated successfully!'})
+
+    def handle_import_pets(self):
+        user = self.user
+
+        content_type = self.headers.get('Content-Type', '')
+        if not content_type.startswith('multipart/form-data'):
+            self.send_json({'error': 'Invalid content type'}, 400)
+            return
+
+        # The data file and photo archive are spooled to temp files in uploads/
         try:
-            price_value = int(price) if price and price.isdigit() else 0
-            cursor.execute('''
-                INSERT INTO pets (name, age, breed, species, bio, image, donated_by, status, created_at, location, price)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (name, int(age), breed, species, bio, filepath, user['id'], 'available', datetime.now(), location, price_value))
-            conn.commit()
-            self.send_json({'message': 'Pet donated successfully!'})
-        except Exception as e:
-            print(f"Error donating pet: {e}")
-            self.send_json({'error': 'Failed to donate pet'}, 500)
+            boundary = MultipartParser.boundary_from(content_type)
+            content_length = int(self.headers.get('Content-Length', 0))
+            parser = MultipartParser(self.rfile, boundary, content_length, upload_dir='uploads',
+                                     max_file_size=MAX_IMPORT_UPLOAD_SIZE)
+            form_data, files = parser.parse()
+        except MultipartError as e:
+            self.send_json({'error': str(e)}, e.status)
+            return
+        except (ValueError, UnicodeDecodeError):
+            self.send_json({'error': 'Invalid form data'}, 400)
+            return
+
+        try:
+            self.import_pets(user, form_data, files)
         finally:
-            conn.close()
+            parser.cleanup()
 
-    def handle_remove_donation(self):
-        user = self.get_current_user()
-        if not user:
-            self.send_json({'error': 'Not authenticated'}, 401)
+    def import_pets(self, user, form_data, files):
+        if 'data' not in files or not files['data']['filename']:
+            self.send_json({'error': 'A CSV or NDJSON data file is required'}, 400)
+            return
+
+        archive = None
+        try:
+            if 'images' in files and files['images']['filename']:
+                archive = ImportArchive(files['images']['path'])
+            rows = read_import_rows(files['data']['path'], files['data']['filename'],
+                                    form_data.get('format', '').strip().lower() or None)
+            # Reading the first row surfaces a bad format before anything is sent
+            rows = itertools.chain([next(rows)], rows)
+        except StopIteration:
+            self.send_json({'error': 'The data file has no rows'}, 400)
             return
+        except (ValueError, OSError) as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+
+        importer = PetImporter(user['id'], archive)
+        try:
+            if 'application/x-ndjson' not in self.headers.get('Accept', ''):
+                self.send_json(importer.run(rows))
+                return
+
+            # Stream a progress line per batch; the response ends when the connection closes
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Cache-Control', 'no-store')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+
+            def progress(report):
+                line = {'progress': {name: report[name] for name in ('rows', 'imported', 'failed')}}
+                self.wfile.write(json.dumps(line).encode('utf-8') + b'\n')
+                self.wfile.flush()
+
+            report = importer.run(rows, progress)
+            self.wfile.write(json.dumps({'done': report}).encode('utf-8') + b'\n')
+        finally:
+            if archive is not None:
+                archive.close()
+
+    def handle_remove_donation(self):
+        user = self.user
         
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        data = json.loads(post_data.decode('utf-8'))
+        data = self.body
         
         donation_id = data.get('donation_id')
         
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
         
-        # Verify ownership
-        cursor.execute('SELECT donated_by FROM pets WHERE id = ?', (donation_id,))
-        pet = cursor.fetchone()
+            # Verify ownership
+            cursor.execute('SELECT donated_by FROM pets WHERE id = ?', (donation_id,))
+            pet = cursor.fetchone()
         
-        if not pet or pet[0] != user['id']:
-            self.send_json({'error': 'Pet not found or unauthorized'}, 400)
-            conn.close()
-            return
+            if not pet or pet[0] != user['id']:
+                self.send_json({'error': 'Pet not found or unauthorized'}, 400)
+                return
         
-        try:
-            # Delete all applications for this pet
-            cursor.execute('DELETE FROM adoption_applications WHERE pet_id = ?', (donation_id,))
+            try:
+                # Delete all applications for this pet
+                cursor.execute('DELETE FROM adoption_applications WHERE pet_id = ?', (donation_id,))
             
-            # Delete the pet
-            cursor.execute('DELETE FROM pets WHERE id = ?', (donation_id,))
+                # Delete the pet
+                cursor.execute('DELETE FROM pets WHERE id = ?', (donation_id,))
             
-            conn.commit()
-            self.send_json({'message': 'Donation deleted successfully'})
-        except Exception as e:
-            conn.rollback()
-            self.send_json({'error': 'Failed to delete donation'}, 500)
-        finally:
-            conn.close()
+                conn.commit()
+                catalogue.bump()
+                self.send_json({'message': 'Donation deleted successfully'})
+            except Exception as e:
+                conn.rollback()
+                self.send_json({'error': 'Failed to delete donation'}, 500)
 
     def handle_delete_pet(self):
-        user = self.get_current_user()
-        if not user or user['email'] != 'admin@petcenter.com':
-            self.send_json({'error': 'Unauthorized'}, 403)
-            return
-        
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        data = json.loads(post_data.decode('utf-8'))
+        data = self.body
         
         pet_id = data.get('pet_id')
         
-        conn = sqlite3.connect('pets.db')
-        cursor = conn.cursor()
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            # Delete all applications for this pet
-            cursor.execute('DELETE FROM adoption_applications WHERE pet_id = ?', (pet_id,))
+            try:
+                # Delete all applications for this pet
+                cursor.execute('DELETE FROM adoption_applications WHERE pet_id = ?', (pet_id,))
             
-            # Delete any adoptions for this pet
-            cursor.execute('DELETE FROM adoptions WHERE pet_id = ?', (pet_id,))
+                # Delete any adoptions for this pet
+                cursor.execute('DELETE FROM adoptions WHERE pet_id = ?', (pet_id,))
             
-            # Delete the pet
-            cursor.execute('DELETE FROM pets WHERE id = ?', (pet_id,))
+                # Delete the pet
+                cursor.execute('DELETE FROM pets WHERE id = ?', (pet_id,))
             
-            conn.commit()
-            self.send_json({'message': 'Pet deleted successfully'})
-        except Exception as e:
-            conn.rollback()
-            self.send_json({'error': 'Failed to delete pet'}, 500)
-        finally:
-            conn.close()
+                conn.commit()
+                catalogue.bump()
+                self.send_json({'message': 'Pet deleted successfully'})
+            except Exception as e:
+                conn.rollback()
+                self.send_json({'error': 'Failed to delete pet'}, 500)
 
 def init_database():
-    conn = sqlite3.connect('pets.db')
+    global pets_fts_enabled
+    conn = sqlite3.connect(db_pool.path)
     cursor = conn.cursor()
     
     # Create tables
@@ -867,7 +3491,7 @@ def init_database():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             session_id TEXT UNIQUE NOT NULL,
             user_id INTEGER NOT NULL,
-            expires_at TIMESTAMP NOT NULL,
+            expires_at INTEGER NOT NULL,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
     ''')
@@ -880,7 +3504,7 @@ def init_database():
         cursor.execute('''
             INSERT INTO users (name, email, password_hash, phone)
             VALUES (?, ?, ?, ?)
-        ''', ('Admin User', 'admin@petcenter.com', sample_password, '555-0123'))
+        ''', ('Admin User', ADMIN_EMAIL, sample_password, '555-0123'))
         
         admin_id = cursor.lastrowid
         
@@ -903,10 +3527,565 @@ def init_database():
             ''', (*pet[:6], admin_id, 'available', datetime.now(), pet[6], pet[7]))
     
     conn.commit()
+    
+    migrate_database(conn)
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pets_fts'")
+    pets_fts_enabled = cursor.fetchone() is not None
+    conn.close()
+
+def migrate_v1_hot_path_indexes(cursor):
+    # /api/pets: status is always filtered, then sorted by created_at or price
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pets_status_created ON pets (status, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pets_status_price ON pets (status, price)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pets_status_species_created ON pets (status, species, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pets_status_location_created ON pets (status, location, created_at)')
+    # /api/my-donations and ownership checks
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pets_donor_created ON pets (donated_by, created_at)')
+    # Application lookups by pet (donor dashboard, apply, delete) and by applicant
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_applications_pet_applied ON adoption_applications (pet_id, applied_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_applications_applicant_applied ON adoption_applications (applicant_id, applied_at)')
+    # /api/adoptions and pet deletion
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_adoptions_adopter_adopted ON adoptions (adopter_id, adopted_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_adoptions_pet ON adoptions (pet_id)')
+
+def migrate_v2_pets_full_text_search(cursor):
+    # External-content FTS5 index over the searchable pet text, kept in
+    # step with pets by triggers so every write path stays in sync
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS pets_fts USING fts5(
+                name, breed, bio,
+                content='pets', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search unavailable, search will scan: {e}")
+        return
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS pets_fts_after_insert AFTER INSERT ON pets BEGIN
+            INSERT INTO pets_fts (rowid, name, breed, bio) VALUES (new.id, new.name, new.breed, new.bio);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS pets_fts_after_delete AFTER DELETE ON pets BEGIN
+            INSERT INTO pets_fts (pets_fts, rowid, name, breed, bio)
+            VALUES ('delete', old.id, old.name, old.breed, old.bio);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS pets_fts_after_update AFTER UPDATE OF name, breed, bio ON pets BEGIN
+            INSERT INTO pets_fts (pets_fts, rowid, name, breed, bio)
+            VALUES ('delete', old.id, old.name, old.breed, old.bio);
+            INSERT INTO pets_fts (rowid, name, breed, bio) VALUES (new.id, new.name, new.breed, new.bio);
+        END
+    ''')
+    # Index the pets that already exist
+    cursor.execute("INSERT INTO pets_fts (pets_fts) VALUES ('rebuild')")
+
+def migrate_v3_session_epoch_expiry(cursor):
+    # expires_at was a local-time datetime string compared as text; store
+    # UTC epoch seconds instead and index it for lookups and the sweeper.
+    # SQLite can't change a column type, so the table is rebuilt, dropping
+    # sessions that have already expired.
+    cursor.execute('''
+        CREATE TABLE sessions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT UNIQUE NOT NULL,
+            user_id INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO sessions_new (id, session_id, user_id, expires_at)
+        SELECT id, session_id, user_id, expiry FROM (
+            SELECT id, session_id, user_id,
+                   CASE typeof(expires_at)
+                       WHEN 'text' THEN CAST(strftime('%s', expires_at, 'utc') AS INTEGER)
+                       ELSE CAST(expires_at AS INTEGER)
+                   END AS expiry
+            FROM sessions
+        )
+        WHERE expiry > CAST(strftime('%s', 'now') AS INTEGER)
+    ''')
+    cursor.execute('DROP TABLE sessions')
+    cursor.execute('ALTER TABLE sessions_new RENAME TO sessions')
+    cursor.execute('CREATE INDEX idx_sessions_expires ON sessions (expires_at)')
+
+def create_pet_count_triggers(cursor):
+    """Triggers on pets that keep pet_counts in step
+
+    location may be NULL, and NULLs never conflict on the primary key or
+    compare equal with =, so groups are matched with IS and created with
+    an explicit existence check rather than an upsert.
+    """
+    # Adding a pet only widens its group's price range. Removing one whose
+    # price was at either end of the range rescans just that group.
+    add_available = '''
+        INSERT INTO pet_counts (species, location, age, available)
+        SELECT new.species, new.location, new.age, 0 WHERE new.status = 'available' AND NOT EXISTS (
+            SELECT 1 FROM pet_counts
+            WHERE species IS new.species AND location IS new.location AND age IS new.age
+        );
+        UPDATE pet_counts SET
+            available = available + 1,
+            min_price = min(coalesce(min_price, new.price), coalesce(new.price, min_price)),
+            max_price = max(coalesce(max_price, new.price), coalesce(new.price, max_price))
+        WHERE species IS new.species AND location IS new.location AND age IS new.age
+        AND new.status = 'available';
+    '''
+    remove_available = '''
+        UPDATE pet_counts SET
+            available = available - 1,
+            min_price = CASE WHEN old.price <= min_price THEN (
+                SELECT MIN(p.price) FROM pets p WHERE p.status = 'available'
+                AND p.species IS old.species AND p.location IS old.location AND p.age IS old.age
+            ) ELSE min_price END,
+            max_price = CASE WHEN old.price >= max_price THEN (
+                SELECT MAX(p.price) FROM pets p WHERE p.status = 'available'
+                AND p.species IS old.species AND p.location IS old.location AND p.age IS old.age
+            ) ELSE max_price END
+        WHERE species IS old.species AND location IS old.location AND age IS old.age
+        AND old.status = 'available';
+    '''
+    cursor.execute(f'CREATE TRIGGER pets_counters_after_insert AFTER INSERT ON pets BEGIN {add_available} END')
+    cursor.execute(f'CREATE TRIGGER pets_counters_after_delete AFTER DELETE ON pets BEGIN {remove_available} END')
+    cursor.execute(f'''
+        CREATE TRIGGER pets_counters_after_update
+        AFTER UPDATE OF status, species, location, age, price ON pets BEGIN {remove_available} {add_available} END
+    ''')
+
+def migrate_v4_counters(cursor):
+    # Counts kept up to date by triggers so reads don't aggregate: each
+    # pet's application total, each donor's pending applications, and the
+    # available pets per (species, location, age) with their price range
+    cursor.execute('ALTER TABLE pets ADD COLUMN application_count INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+        CREATE TABLE donor_stats (
+            donor_id INTEGER PRIMARY KEY,
+            pending_applications INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE pet_counts (
+            species TEXT,
+            location TEXT,
+            age INTEGER,
+            available INTEGER NOT NULL DEFAULT 0,
+            min_price INTEGER,
+            max_price INTEGER,
+            PRIMARY KEY (species, location, age)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER applications_counters_after_insert AFTER INSERT ON adoption_applications BEGIN
+            UPDATE pets SET application_count = application_count + 1 WHERE id = new.pet_id;
+            INSERT INTO donor_stats (donor_id, pending_applications)
+            SELECT new.donor_id, 1 WHERE new.status = 'pending'
+            ON CONFLICT (donor_id) DO UPDATE SET pending_applications = pending_applications + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER applications_counters_after_delete AFTER DELETE ON adoption_applications BEGIN
+            UPDATE pets SET application_count = application_count - 1 WHERE id = old.pet_id;
+            UPDATE donor_stats SET pending_applications = pending_applications - 1
+            WHERE donor_id = old.donor_id AND old.status = 'pending';
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER applications_counters_after_update
+        AFTER UPDATE OF pet_id, donor_id, status ON adoption_applications BEGIN
+            UPDATE pets SET application_count = application_count - 1
+            WHERE id = old.pet_id AND new.pet_id IS NOT old.pet_id;
+            UPDATE pets SET application_count = application_count + 1
+            WHERE id = new.pet_id AND new.pet_id IS NOT old.pet_id;
+            UPDATE donor_stats SET pending_applications = pending_applications - 1
+            WHERE donor_id = old.donor_id AND old.status = 'pending';
+            INSERT INTO donor_stats (donor_id, pending_applications)
+            SELECT new.donor_id, 1 WHERE new.status = 'pending'
+            ON CONFLICT (donor_id) DO UPDATE SET pending_applications = pending_applications + 1;
+        END
+    ''')
+
+    create_pet_count_triggers(cursor)
+
+    repair_counters(cursor)
+
+def migrate_v5_catalogue_generation(cursor):
+    # The listing cache generation, kept in the database so a write from
+    # any process invalidates every server's cached listings
+    cursor.execute('''
+        CREATE TABLE catalogue_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT INTO catalogue_generation (id, value) VALUES (1, 0)')
+    bump = 'UPDATE catalogue_generation SET value = value + 1;'
+    cursor.execute(f'CREATE TRIGGER pets_catalogue_after_insert AFTER INSERT ON pets BEGIN {bump} END')
+    cursor.execute(f'CREATE TRIGGER pets_catalogue_after_delete AFTER DELETE ON pets BEGIN {bump} END')
+    cursor.execute(f'''
+        CREATE TRIGGER pets_catalogue_after_update
+        AFTER UPDATE OF {PET_COLUMNS} ON pets BEGIN {bump} END
+    ''')
+
+def migrate_v6_null_safe_pet_counts(cursor):
+    # The first pet_counts triggers matched groups with =, so pets without
+    # a location were added as a new row each time and never removed
+    for event in ('insert', 'delete', 'update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS pets_counters_after_{event}')
+    create_pet_count_triggers(cursor)
+    repair_counters(cursor)
+
+# Schema migrations as (version, description, function). The database's
+# PRAGMA user_version records the last one applied; append new steps only.
+MIGRATIONS = [
+    (1, 'indexes for listing, dashboard and application queries', migrate_v1_hot_path_indexes),
+    (2, 'full-text search index for pets', migrate_v2_pets_full_text_search),
+    (3, 'integer epoch session expiry with an index', migrate_v3_session_epoch_expiry),
+    (4, 'trigger-maintained application and availability counters', migrate_v4_counters),
+    (5, 'shared catalogue generation for the listing caches', migrate_v5_catalogue_generation),
+    (6, 'NULL-safe pet_counts triggers', migrate_v6_null_safe_pet_counts),
+]
+
+def migrate_database(conn):
+    """Apply any migrations newer than the database's user_version, in place"""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA user_version')
+    current = cursor.fetchone()[0]
+    
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        # Each step and its version bump commit together or not at all
+        cursor.execute('BEGIN')
+        try:
+            migrate(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {version}: {description}")
+
+# Representative shapes of the hot read queries, checked by --check-query-plans
+HOT_QUERY_FILTERS = [
+    {},
+    {'sort': ['oldest']},
+    {'sort': ['price-low']},
+    {'sort': ['price-high']},
+    {'category': ['Dog']},
+    {'category': ['Cat'], 'sort': ['price-low']},
+    {'location': ['dhaka']},
+    {'locations[]': ['dhaka', 'sylhet']},
+    {'search': ['retriever']},
+    {'search': ['golden ret'], 'sort': ['relevance']},
+    {'minPrice': ['1000'], 'maxPrice': ['20000'], 'ages[]': ['1-3', '5+']},
+]
+
+def hot_queries():
+    """Yield (label, sql, params) for every hot query path"""
+    for query in HOT_QUERY_FILTERS:
+        where_clause, params = build_pet_filters(query)
+        sort_option = pet_sort_option(query)
+        label = '/api/pets ' + (json.dumps(query) if query else '(no filters)')
+        yield (label + ' count', *pet_count_query(query))
+        yield (label, *build_pet_page_query(query, sort_option, 7))
+        yield (label + ' cursor', *build_pet_page_query(query, sort_option, 7, after=(0, 0)))
+        yield (label + ' facets', *pet_facet_query(query))
+    
+    yield '/api/my-donations pets', '''
+        SELECT p.id, p.application_count FROM pets p
+        WHERE p.donated_by = ? ORDER BY p.created_at DESC, p.id DESC
+    ''', [1]
+    yield '/api/my-donations/pending', '''
+        SELECT pending_applications FROM donor_stats WHERE donor_id = ?
+    ''', [1]
+    yield '/api/my-donations applications', '''
+        SELECT aa.* FROM adoption_applications aa JOIN pets p ON aa.pet_id = p.id
+        WHERE p.donated_by = ? ORDER BY p.created_at DESC, p.id DESC, aa.applied_at DESC
+    ''', [1]
+    yield '/api/applications', '''
+        SELECT aa.id, p.name FROM adoption_applications aa JOIN pets p ON aa.pet_id = p.id
+        WHERE aa.applicant_id = ? ORDER BY aa.applied_at DESC
+    ''', [1]
+    yield '/api/adoptions', '''
+        SELECT a.id, p.name FROM adoptions a JOIN pets p ON a.pet_id = p.id
+        WHERE a.adopter_id = ? ORDER BY a.adopted_at DESC
+    ''', [1]
+    yield '/api/apply duplicate check', '''
+        SELECT id FROM adoption_applications WHERE pet_id = ? AND applicant_id = ?
+    ''', [1, 1]
+    yield '/api/delete-pet adoptions', 'DELETE FROM adoptions WHERE pet_id = ?', [1]
+    yield 'session lookup', '''
+        SELECT u.id, s.expires_at FROM users u JOIN sessions s ON u.id = s.user_id
+        WHERE s.session_id = ? AND s.expires_at > ?
+    ''', ['', 0]
+    yield 'session sweep', '''
+        DELETE FROM sessions WHERE id IN (SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?)
+    ''', [0, 500]
+
+def repair_counters(cursor):
+    """Recompute every trigger-maintained counter from the base tables
+
+    Returns {counter: rows that were wrong}; all zero when the triggers
+    have kept up.
+    """
+    drift = {}
+    cursor.execute('''
+        UPDATE pets SET application_count = (
+            SELECT COUNT(*) FROM adoption_applications aa WHERE aa.pet_id = pets.id
+        )
+        WHERE application_count IS NOT (
+            SELECT COUNT(*) FROM adoption_applications aa WHERE aa.pet_id = pets.id
+        )
+    ''')
+    drift['pets.application_count'] = cursor.rowcount
+
+    summaries = [
+        ('donor_stats', '''
+            SELECT donor_id, COUNT(*) FROM adoption_applications
+            WHERE status = 'pending' GROUP BY donor_id
+        ''', 'SELECT donor_id, pending_applications FROM donor_stats WHERE pending_applications != 0'),
+        ('pet_counts', '''
+            SELECT species, location, age, COUNT(*), MIN(price), MAX(price) FROM pets
+            WHERE status = 'available' GROUP BY species, location, age
+        ''', 'SELECT species, location, age, available, min_price, max_price FROM pet_counts WHERE available != 0'),
+    ]
+    for table, expected, actual in summaries:
+        cursor.execute(f'''
+            SELECT COUNT(*) FROM (
+                SELECT * FROM ({expected} EXCEPT {actual})
+                UNION ALL
+                SELECT * FROM ({actual} EXCEPT {expected})
+            )
+        ''')
+        drift[table] = cursor.fetchone()[0]
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(f'INSERT INTO {table} {expected}')
+    return drift
+
+def check_query_plans(conn):
+    """Return (label, plan detail) for every hot query that scans a whole table"""
+    cursor = conn.cursor()
+    full_scans = []
+    for label, sql, params in hot_queries():
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        for row in cursor.fetchall():
+            if is_full_scan(row[3]):
+                full_scans.append((label, row[3]))
+    return full_scans
+
+def run_import_command(data_path, images_path, donor_email):
+    """Bulk-import pets from the command line; returns the exit status"""
+    conn = sqlite3.connect(db_pool.path)
+    donor = conn.execute('SELECT id FROM users WHERE email = ?', (donor_email,)).fetchone()
     conn.close()
+    if donor is None:
+        print(f"No user with email {donor_email}")
+        return 1
+
+    archive = None
+    try:
+        if images_path:
+            archive = ImportArchive(images_path)
+        os.makedirs('uploads', exist_ok=True)
+
+        def progress(report):
+            print(f"{report['rows']} rows read, {report['imported']} imported, {report['failed']} failed", flush=True)
+
+        report = PetImporter(donor[0], archive).run(read_import_rows(data_path), progress)
+    except (ValueError, OSError) as e:
+        print(f"Import failed: {e}")
+        return 1
+    finally:
+        if archive is not None:
+            archive.close()
+
+    for error in report['errors']:
+        print(f"Row {error['row']}: {error['error']}")
+    if report['failed'] > len(report['errors']):
+        print(f"... and {report['failed'] - len(report['errors'])} more failed rows")
+    print(f"Imported {report['imported']} of {report['rows']} rows in {report['seconds']}s "
+          f"({report['rows'] / max(report['seconds'], 0.001):.0f} rows/s)")
+    # Finish the photo variants before exiting
+    image_pipeline.drain()
+    return 1 if report['failed'] else 0
+
+def install_shutdown_handlers(server):
+    """Stop accepting on SIGTERM/SIGINT and let in-flight requests finish"""
+    def handle_signal(signum, frame):
+        # shutdown() blocks until serve_forever exits, so it can't run on the
+        # thread that is inside serve_forever
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+def run_server(server):
+    install_shutdown_handlers(server)
+    session_sweeper.start()
+    metrics.start()
+    server.serve_forever()
+    metrics.stop()
+    session_sweeper.stop()
+    if isinstance(server, (PooledHTTPServer, AsyncHTTPServer)):
+        server.drain()
+    else:
+        server.server_close()
+
+def run_prefork(server, workers):
+    """Fork worker processes that all accept on the already-bound listening socket"""
+    children = set()
+    stopping = False
+    # Every worker publishes its metrics here so any of them can report the totals
+    metrics.shared_dir = tempfile.mkdtemp(prefix='petcenter-metrics-')
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_server(server)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def handle_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for _ in range(workers):
+        spawn()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        # Replace workers that die unexpectedly
+        if not stopping:
+            spawn()
+
+    server.server_close()
+    shutil.rmtree(metrics.shared_dir, ignore_errors=True)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Pet adoption server')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--mode', choices=['single', 'threaded', 'prefork', 'asyncio'], default='threaded',
+                        help='single: one request at a time; threaded: worker thread pool; '
+                             'prefork: several processes, each with a worker thread pool; '
+                             'asyncio: event loop with HTTP/1.1 keep-alive, handlers on a worker thread pool')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='worker threads per process (threaded, prefork and asyncio modes)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                        help='worker processes (prefork mode)')
+    parser.add_argument('--db-pool-size', type=int, default=None,
+                        help='SQLite connections per process (default: one per worker thread)')
+    parser.add_argument('--access-log', metavar='PATH',
+                        help="write a JSON line per request to PATH ('-' for stdout) instead of the default log")
+    parser.add_argument('--slow-query-ms', type=float, default=100,
+                        help='log SQL statements slower than this and keep their query plans (default 100)')
+    parser.add_argument('--metrics-token',
+                        help='bearer token that lets a scraper read /metrics; without it only the admin can')
+    parser.add_argument('--check-query-plans', action='store_true',
+                        help='migrate the database, report any hot query that does a full table scan, and exit')
+    parser.add_argument('--keepalive-timeout', type=float, default=None,
+                        help='seconds an idle HTTP/1.1 connection is kept open (default: 5, or 15 in asyncio mode); '
+                             '0 turns keep-alive off in threaded and prefork modes')
+    parser.add_argument('--max-keepalive-requests', type=int, default=100,
+                        help='requests served on one connection before it is closed (default 100)')
+    parser.add_argument('--compress-min-size', type=int, default=CompressedBody.min_size,
+                        help='smallest JSON response, in bytes, that is gzip/brotli compressed (default 1024)')
+    parser.add_argument('--gzip-level', type=int, choices=range(1, 10), default=CompressedBody.gzip_level,
+                        metavar='1-9', help='gzip level for JSON responses (default 6)')
+    parser.add_argument('--brotli-quality', type=int, choices=range(0, 12), default=CompressedBody.brotli_quality,
+                        metavar='0-11', help='brotli quality for JSON responses when brotli is installed (default 5)')
+    parser.add_argument('--session-sweep-interval', type=float, default=300,
+                        help='seconds between deletes of expired sessions; 0 disables (default 300)')
+    parser.add_argument('--repair-counters', action='store_true',
+                        help='migrate the database, rebuild the trigger-maintained counters, report any drift, and exit')
+    parser.add_argument('--import-pets', metavar='DATA',
+                        help='bulk-import pets from a CSV or NDJSON file and exit')
+    parser.add_argument('--images', metavar='ARCHIVE',
+                        help='zip or tar of the photos named in the import rows')
+    parser.add_argument('--donor-email', default=ADMIN_EMAIL,
+                        help='user the imported pets are donated by (default: the admin)')
+    return parser.parse_args()
 
 if __name__ == '__main__':
+    args = parse_args()
+    missing = router.missing_handlers(PetAdoptionHandler)
+    if missing:
+        for route in missing:
+            print(f"Route {route.method} {route.pattern} points at missing handler {route.handler}")
+        raise SystemExit(1)
+    db_pool.size = args.db_pool_size or (1 if args.mode == 'single' else args.threads)
+    if args.access_log:
+        access_log = AccessLog(args.access_log)
+    slow_queries.threshold = args.slow_query_ms / 1000
+    metrics.token = args.metrics_token
+    session_sweeper.interval = args.session_sweep_interval
+    CompressedBody.min_size = args.compress_min_size
+    CompressedBody.gzip_level = args.gzip_level
+    CompressedBody.brotli_quality = args.brotli_quality
+    PetAdoptionHandler.max_keepalive_requests = args.max_keepalive_requests
+    if args.keepalive_timeout is not None:
+        PooledHTTPServer.keepalive_timeout = AsyncHTTPServer.keepalive_timeout = args.keepalive_timeout
+    if args.mode == 'single' or args.keepalive_timeout == 0:
+        # One connection at a time can't afford to wait on an idle client
+        PetAdoptionHandler.protocol_version = 'HTTP/1.0'
     init_database()
-    server = HTTPServer(('localhost', 8000), PetAdoptionHandler)
-    print("Server running on http://localhost:8000")
-    server.serve_forever()
\ No newline at end of file
+    
+    if args.repair_counters:
+        conn = sqlite3.connect(db_pool.path)
+        conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.cursor()
+        drift = repair_counters(cursor)
+        # pet_counts feeds the cached totals and facets
+        catalogue.bump_stored(cursor)
+        conn.commit()
+        conn.close()
+        for counter, rows in drift.items():
+            print(f"{counter}: {rows} rows were wrong")
+        raise SystemExit(0)
+    
+    if args.import_pets:
+        raise SystemExit(run_import_command(args.import_pets, args.images, args.donor_email))
+    
+    if args.check_query_plans:
+        conn = sqlite3.connect(db_pool.path)
+        full_scans = check_query_plans(conn)
+        conn.close()
+        for label, detail in full_scans:
+            print(f"FULL SCAN in {label}: {detail}")
+        print(f"{len(full_scans)} hot queries do full table scans")
+        raise SystemExit(1 if full_scans else 0)
+    
+    # Loaded before forking so prefork workers share the compressed copies
+    asset_cache.preload()
+    address = (args.host, args.port)
+    if args.mode == 'single':
+        server = HTTPServer(address, PetAdoptionHandler)
+    elif args.mode == 'asyncio':
+        server = AsyncHTTPServer(address, PetAdoptionHandler, threads=args.threads)
+    else:
+        server = PooledHTTPServer(address, PetAdoptionHandler, threads=args.threads)
+    print(f"Server running on http://{args.host}:{args.port} ({args.mode} mode)", flush=True)
+    if args.mode == 'prefork':
+        run_prefork(server, args.workers)
+    else:
+        run_server(server)
@@ -0,0 +1,39 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import server
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """A freshly initialized database with its sample pets"""
+    path = str(tmp_path / 'pets.db')
+    monkeypatch.setattr(server.db_pool, 'path', path)
+    monkeypatch.setattr(server, 'pets_fts_enabled', False)
+    server.init_database()
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def search(conn, text):
+    query = {'search': [text]}
+    sql, params = server.build_pet_page_query(query, server.pet_sort_option(query), 100)
+    return [row[1] for row in conn.execute(sql, params)]
+
+
+def test_search_uses_full_text_index(conn):
+    assert server.pets_fts_enabled
+    assert search(conn, 'golden retr') == ['Buddy']
+
+
+def test_search_without_word_characters_still_filters(conn):
+    assert search(conn, '!!') == []
+    conn.execute("UPDATE pets SET bio = bio || ' !!' WHERE name = 'Luna'")
+    assert search(conn, '!!') == ['Luna']
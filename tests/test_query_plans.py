@@ -0,0 +1,52 @@
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import server
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Point the server at a database in tmp_path; returns its path"""
+    path = str(tmp_path / 'pets.db')
+    monkeypatch.setattr(server.db_pool, 'path', path)
+    monkeypatch.setattr(server, 'pets_fts_enabled', False)
+    return path
+
+
+def test_fresh_database_has_no_full_scans(database):
+    server.init_database()
+    conn = sqlite3.connect(database)
+    try:
+        assert server.check_query_plans(conn) == []
+    finally:
+        conn.close()
+
+
+def test_migrated_database_has_no_full_scans(database):
+    # The database shipped with the project predates every migration
+    shutil.copy(os.path.join(ROOT, 'project', 'pets.db'), database)
+    server.init_database()
+    conn = sqlite3.connect(database)
+    try:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == server.MIGRATIONS[-1][0]
+        assert server.check_query_plans(conn) == []
+    finally:
+        conn.close()
+
+
+def test_missing_index_is_reported(database):
+    server.init_database()
+    conn = sqlite3.connect(database)
+    try:
+        conn.execute('DROP INDEX idx_pets_donor_created')
+        labels = [label for label, detail in server.check_query_plans(conn)]
+        assert '/api/my-donations pets' in labels
+    finally:
+        conn.close()